@@ -1,16 +1,101 @@
 # -*- encoding: utf-8 -*-
 # Created by han on 17-7-8
 
+import os
 import random
 import numpy as np
+import tensorflow as tf
 import cPickle
 
+# inputs consumed by each model besides the label y
+# models compute the position features from the entity offsets epos
+model_inputs = {
+    'cnn': ['x', 'epos'],
+    'pcnn': ['x', 'epos'],
+    'cnn_deep': ['x', 'epos'],
+    'rnn': ['x', 'epos', 'len'],
+    'birnn': ['x', 'epos', 'len'],
+    'birnn_deep': ['x', 'epos'],
+    'birnn_att': ['x', 'epos', 'len'],
+    'birnn_selfatt': ['x', 'epos', 'len'],
+    'birnn_res': ['x', 'epos'],
+    'birnn_ent': ['x', 'epos', 'len', 'e1', 'e2', 'e1_len', 'e2_len'],
+    'birnn_att_ent': ['x', 'epos', 'len', 'e1', 'e2', 'e1_len', 'e2_len'],
+    'birnn_cnn_ent': ['x', 'epos', 'len', 'e1', 'e2', 'e1_len', 'e2_len'],
+    'birnn_res_ent': ['x', 'epos', 'e1', 'e2'],
+    'birnn_mi': ['x', 'epos', 'len']
+}
+
+# s-ins file of each feature as (word level, character level), entity use character representation
+# pos1 and pos2 are only written by older preprocessing, epos is then computed from them
+s_ins_files = {
+    'y': ('y', 'y'),
+    'x': ('word', 'char'),
+    'epos': ('epos', 'epos_c'),
+    'pos1': ('pos1', 'pos1_c'),
+    'pos2': ('pos2', 'pos2_c'),
+    'len': ('len', 'len_c'),
+    'e1': ('e1_c', 'e1_c'),
+    'e2': ('e2_c', 'e2_c'),
+    'e1_len': ('e1_len_c', 'e1_len_c'),
+    'e2_len': ('e2_len_c', 'e2_len_c')
+}
+
+
+def compute_entity_pos(pos1, pos2):
+    """
+    get positions of entity 1 and entity 2, shape [s_num, 2], from the last relative position of each sentence
+    for features written by older preprocessing, which stored full relative position matrices
+    """
+    s_max_l = pos1.shape[1]
+    # the last slot, s_max_l - 1 - e shifted by s_max_l + 1, is only clipped for entities at 2 * s_max_l or later,
+    # all their positions are clipped so 2 * s_max_l gives the same ones; positions may be stored unsigned
+    p_e1 = 2 * s_max_l - pos1[:, -1].astype(np.int64)
+    p_e2 = 2 * s_max_l - pos2[:, -1].astype(np.int64)
+    return np.stack([p_e1, p_e2], axis=1).astype(np.int32)
+
+
+def label_ids(y):
+    """
+    integer class labels, one-hot rows written by older preprocessing are reduced by argmax
+    """
+    return np.argmax(y, axis=1).astype(np.uint8 if y.shape[1] <= 256 else np.int32) if y.ndim == 2 else y
+
+
+def take(array, order):
+    """
+    gather rows of a feature array, None for features that are not loaded
+    """
+    return None if array is None else array[order]
+
+
+def dedup_entities(input_data):
+    """
+    distinct entity rows of e1 and e2 in ent, with their ent_len if lengths are loaded,
+    e1_idx / e2_idx are the row of the entities of each instance, the model encodes every distinct entity once
+    """
+    if input_data.e1 is None:
+        return input_data
+    ents = np.ascontiguousarray(np.concatenate([input_data.e1, input_data.e2]))
+    # one void item per row, np.unique then compares whole id sequences
+    rows = ents.view(np.dtype((np.void, ents.dtype.itemsize * ents.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    input_data.ent = ents[first]
+    if input_data.e1_len is not None:
+        input_data.ent_len = np.concatenate([input_data.e1_len, input_data.e2_len])[first]
+    batch_size = len(input_data.e1)
+    input_data.e1_idx = inverse[:batch_size].astype(np.int32)
+    input_data.e2_idx = inverse[batch_size:].astype(np.int32)
+    return input_data
+
 
 class InputData(object):
     """
     data structure feed to the model
+    y is integer class labels, features keep their narrow on-disk dtypes, the graph widens them
+    multi-instance data keeps instance features flat, instances of bag i are [bag_shapes[i]:bag_shapes[i + 1]]
     """
-    def __init__(self, y, x, pos1, pos2, slen, e1, e2, e1_len, e2_len, mask):
+    def __init__(self, y, x, pos1, pos2, slen, e1, e2, e1_len, e2_len, epos, bag_shapes=None):
         self.y = y
         self.x = x
         self.pos1 = pos1
@@ -20,155 +105,167 @@ class InputData(object):
         self.e2 = e2
         self.e1_len = e1_len
         self.e2_len = e2_len
-        self.mask = mask
+        self.epos = epos
+        self.bag_shapes = bag_shapes
+        # distinct entities, set by dedup_entities
+        self.ent = None
+        self.ent_len = None
+        self.e1_idx = None
+        self.e2_idx = None
 
 
 class DataLoader(object):
     """
     load data the model needed
     """
-    def __init__(self, data_dir, multi_ins=False, c_feature=False):
+    def __init__(self, data_dir, multi_ins=False, c_feature=False, model_name=None, mmap_mode=None, bucket_width=0,
+                 trim_ent=False):
+        """
+        :param model_name: only load the features model_inputs[model_name] needs, others are None, None loads all
+        :param mmap_mode: mmap_mode of np.load for s-ins features, 'r' maps the arrays instead of reading them
+        :param bucket_width: if > 0, training batches group sentences of similar length and are trimmed to
+                             the longest one, rounded up to bucket_width, the model must take variable time steps
+        :param trim_ent: cut the entity padding of every batch to its longest entity, the model must take
+                         variable entity steps
+        """
+        assert not (multi_ins and bucket_width), 'bucketing does not support multi-instance bags'
         self.multi_ins = multi_ins
         self.c_feature = c_feature
+        self.mmap_mode = mmap_mode
+        self.bucket_width = bucket_width
+        self.trim_ent = trim_ent
         if c_feature:
             self.embedding = np.load('{}/char_vec.npy'.format(data_dir))
-
-            self.train_y = np.load('{}/s-ins/train_y.npy'.format(data_dir))
-            self.train_x = np.load('{}/s-ins/train_char.npy'.format(data_dir))
-            self.train_pos1 = np.load('{}/s-ins/train_pos1_c.npy'.format(data_dir))
-            self.train_pos2 = np.load('{}/s-ins/train_pos2_c.npy'.format(data_dir))
-            self.train_len = np.load('{}/s-ins/train_len_c.npy'.format(data_dir))
-            # self.train_e1 = np.load('{}/s-ins/train_e1_c.npy'.format(data_dir))
-            # self.train_e2 = np.load('{}/s-ins/train_e2_c.npy'.format(data_dir))
-            # self.train_e1_len = np.load('{}/s-ins/train_e1_len_c.npy'.format(data_dir))
-            # self.train_e2_len = np.load('{}/s-ins/train_e2_len_c.npy'.format(data_dir))
-
-            self.test_y = np.load('{}/s-ins/test_y.npy'.format(data_dir))
-            self.test_x = np.load('{}/s-ins/test_char.npy'.format(data_dir))
-            self.test_pos1 = np.load('{}/s-ins/test_pos1_c.npy'.format(data_dir))
-            self.test_pos2 = np.load('{}/s-ins/test_pos2_c.npy'.format(data_dir))
-            self.test_len = np.load('{}/s-ins/test_len_c.npy'.format(data_dir))
-            # self.test_e1 = np.load('{}/s-ins/test_e1_c.npy'.format(data_dir))
-            # self.test_e2 = np.load('{}/s-ins/test_e2_c.npy'.format(data_dir))
-            # self.test_e1_len = np.load('{}/s-ins/test_e1_len_c.npy'.format(data_dir))
-            # self.test_e2_len = np.load('{}/s-ins/test_e2_len_c.npy'.format(data_dir))
-
         else:
             self.embedding = np.load('{}/word_vec.npy'.format(data_dir))
 
-            self.train_y = np.load('{}/s-ins/train_y.npy'.format(data_dir))
-            self.train_x = np.load('{}/s-ins/train_word.npy'.format(data_dir))
-            self.train_pos1 = np.load('{}/s-ins/train_pos1.npy'.format(data_dir))
-            self.train_pos2 = np.load('{}/s-ins/train_pos2.npy'.format(data_dir))
-            self.train_len = np.load('{}/s-ins/train_len.npy'.format(data_dir))
-            # self.train_e1 = np.load('{}/s-ins/train_e1.npy'.format(data_dir))
-            # self.train_e2 = np.load('{}/s-ins/train_e2.npy'.format(data_dir))
-            # self.train_e1_len = np.load('{}/s-ins/train_e1_len.npy'.format(data_dir))
-            # self.train_e2_len = np.load('{}/s-ins/train_e2_len.npy'.format(data_dir))
-
-            self.test_y = np.load('{}/s-ins/test_y.npy'.format(data_dir))
-            self.test_x = np.load('{}/s-ins/test_word.npy'.format(data_dir))
-            self.test_pos1 = np.load('{}/s-ins/test_pos1.npy'.format(data_dir))
-            self.test_pos2 = np.load('{}/s-ins/test_pos2.npy'.format(data_dir))
-            self.test_len = np.load('{}/s-ins/test_len.npy'.format(data_dir))
-            # self.test_e1 = np.load('{}/s-ins/test_e1.npy'.format(data_dir))
-            # self.test_e2 = np.load('{}/s-ins/test_e2.npy'.format(data_dir))
-            # self.test_e1_len = np.load('{}/s-ins/test_e1_len.npy'.format(data_dir))
-            # self.test_e2_len = np.load('{}/s-ins/test_e2_len.npy'.format(data_dir))
-
-        # entity use character represention
-        self.train_e1 = np.load('{}/s-ins/train_e1_c.npy'.format(data_dir))
-        self.train_e2 = np.load('{}/s-ins/train_e2_c.npy'.format(data_dir))
-        self.train_e1_len = np.load('{}/s-ins/train_e1_len_c.npy'.format(data_dir))
-        self.train_e2_len = np.load('{}/s-ins/train_e2_len_c.npy'.format(data_dir))
-
-        self.test_e1 = np.load('{}/s-ins/test_e1_c.npy'.format(data_dir))
-        self.test_e2 = np.load('{}/s-ins/test_e2_c.npy'.format(data_dir))
-        self.test_e1_len = np.load('{}/s-ins/test_e1_len_c.npy'.format(data_dir))
-        self.test_e2_len = np.load('{}/s-ins/test_e2_len_c.npy'.format(data_dir))
-
-        # mask used in pcnn
-        self.train_mask = self.compute_pcnn_pool_mask(self.train_x, self.train_pos1, self.train_pos2)
-        self.test_mask = self.compute_pcnn_pool_mask(self.test_x, self.test_pos1, self.test_pos2)
+        # features to load, sentence and label are always needed
+        if model_name is None:
+            self.fields = set(s_ins_files.keys()) - {'pos1', 'pos2'}
+        else:
+            self.fields = set(model_inputs[model_name]) | {'y', 'x'}
+        # entities use character representation, the entity models take its embedding
+        if 'e1' in self.fields:
+            self.ent_embedding = self.embedding if c_feature else np.load('{}/char_vec.npy'.format(data_dir))
+        else:
+            self.ent_embedding = None
+        load_fields = set(self.fields)
+        # older preprocessing wrote position matrices instead of the entity offsets
+        epos_fn = s_ins_files['epos'][1 if c_feature else 0]
+        legacy_pos = 'epos' in load_fields and not os.path.exists('{}/s-ins/test_{}.npy'.format(data_dir, epos_fn))
+        if legacy_pos:
+            load_fields = (load_fields - {'epos'}) | {'pos1', 'pos2'}
+        if bucket_width:
+            load_fields |= {'len'}
+        if trim_ent:
+            load_fields |= {'e1_len', 'e2_len'}
+
+        for field in s_ins_files:
+            fn = s_ins_files[field][1 if c_feature else 0]
+            for part in ('train', 'test'):
+                if field in load_fields:
+                    array = np.load('{}/s-ins/{}_{}.npy'.format(data_dir, part, fn), mmap_mode=mmap_mode)
+                    if field == 'y':
+                        array = label_ids(array)
+                else:
+                    array = None
+                setattr(self, '{}_{}'.format(part, field), array)
+
+        # entity positions, the models compute the position features from them
+        if legacy_pos:
+            for part in ('train', 'test'):
+                setattr(self, '{}_epos'.format(part), compute_entity_pos(
+                    getattr(self, '{}_pos1'.format(part)), getattr(self, '{}_pos2'.format(part))
+                ))
+                setattr(self, '{}_pos1'.format(part), None)
+                setattr(self, '{}_pos2'.format(part), None)
 
         self.max_sen_len = len(self.test_x[0])
-        self.max_ent_len = len(self.test_e1[0])
+        # relative positions lie in [-max_sen_len, max_sen_len]
+        self.pos_max_len = self.max_sen_len
+        self.max_ent_len = len(self.test_e1[0]) if self.test_e1 is not None else None
 
         if self.multi_ins:
-            self.train_y_mi = np.load('{}/m-ins/train_y.npy'.format(data_dir))
+            self.train_y_mi = label_ids(np.load('{}/m-ins/train_y.npy'.format(data_dir)))
             self.train_x_mi = np.load('{}/m-ins/train_x.npy'.format(data_dir))
-            self.test_y_mi = np.load('{}/m-ins/test_y.npy'.format(data_dir))
+            self.test_y_mi = label_ids(np.load('{}/m-ins/test_y.npy'.format(data_dir)))
             self.test_x_mi = np.load('{}/m-ins/test_x.npy'.format(data_dir))
 
-            train_x, train_len, train_p1, train_p2 = [], [], [], []
-            train_e1, train_e2, train_e1_len, train_e2_len = [], [], [], []
-            train_mask = []
-            for idx_list in self.train_x_mi:
-                train_x.append(self.train_x[idx_list])
-                train_len.append(self.train_len[idx_list])
-                train_p1.append(self.train_pos1[idx_list])
-                train_p2.append(self.train_pos2[idx_list])
-                train_e1.append(self.train_e1[idx_list])
-                train_e2.append(self.train_e2[idx_list])
-                train_e1_len.append(self.train_e1_len[idx_list])
-                train_e2_len.append(self.train_e2_len[idx_list])
-                train_mask.append(self.train_mask[idx_list])
-
-            self.train_x = np.asarray(train_x)
-            self.train_len = np.asarray(train_len)
-            self.train_pos1 = np.asarray(train_p1)
-            self.train_pos2 = np.asarray(train_p2)
-            self.train_e1 = np.asarray(train_e1)
-            self.train_e2 = np.asarray(train_e2)
-            self.train_e1_len = np.asarray(train_e1_len)
-            self.train_e2_len = np.asarray(train_e2_len)
-            self.train_mask = np.asarray(train_mask)
-
-            test_x, test_len, test_p1, test_p2 = [], [], [], []
-            test_e1, test_e2, test_e1_len, test_e2_len = [], [], [], []
-            test_mask = []
-            for idx_list in self.test_x_mi:
-                test_x.append(self.test_x[idx_list])
-                test_len.append(self.test_len[idx_list])
-                test_p1.append(self.test_pos1[idx_list])
-                test_p2.append(self.test_pos2[idx_list])
-                test_e1.append(self.test_e1[idx_list])
-                test_e2.append(self.test_e2[idx_list])
-                test_e1_len.append(self.test_e1_len[idx_list])
-                test_e2_len.append(self.test_e2_len[idx_list])
-                test_mask.append(self.test_mask[idx_list])
-
-            self.test_x = np.asarray(test_x)
-            self.test_len = np.asarray(test_len)
-            self.test_pos1 = np.asarray(test_p1)
-            self.test_pos2 = np.asarray(test_p2)
-            self.test_e1 = np.asarray(test_e1)
-            self.test_e2 = np.asarray(test_e2)
-            self.test_e1_len = np.asarray(test_e1_len)
-            self.test_e2_len = np.asarray(test_e2_len)
-            self.test_mask = np.asarray(test_mask)
-
-    def compute_pcnn_pool_mask(self, x, pos1,  pos2):
-        """
-        used in pcnn, get piece wise max pooling mask
-        """
-        s_num, s_max_l = x.shape
-        pos1_0 = np.squeeze(pos1[:, :1])
-        pos2_0 = np.squeeze(pos2[:, :1])
-        p_e1 = s_max_l - pos1_0 + 1
-        p_e2 = s_max_l - pos2_0 + 1
-        mask = np.zeros((s_num, 3, s_max_l), dtype=np.float32)
-        for i in range(s_num):
-            p1 = min(p_e1[i], p_e2[i])
-            p2 = max(p_e1[i], p_e2[i])
-            mask[i, 0, :p1] = 1
-            mask[i, 1, p1:p2] = 1
-            mask[i, 2, p2:s_max_l] = 1
-        return mask
-
-    def get_train_batches(self, batch_size):
-        """
-        get training data by batch
+            # bags in csr form, instances of bag i are bag_index[bag_offsets[i]:bag_offsets[i + 1]]
+            self.train_bag_index, self.train_bag_offsets = self.bag_csr(self.train_x_mi)
+            self.test_bag_index, self.test_bag_offsets = self.bag_csr(self.test_x_mi)
+
+    def bag_csr(self, x_mi):
+        """
+        flat instance index of all bags and the offset of each bag in it, offsets has bag number + 1 entries
+        """
+        bag_sizes = np.asarray([len(idx_list) for idx_list in x_mi], dtype=np.int64)
+        bag_offsets = np.concatenate([[0], np.cumsum(bag_sizes)])
+        bag_index = np.concatenate([np.asarray(idx_list, dtype=np.int64) for idx_list in x_mi])
+        return bag_index, bag_offsets
+
+    def bag_instances(self, bag_index, bag_offsets, bag_order):
+        """
+        instance index of the bags bag_order in order, and the bag_shapes of the batch
+        """
+        bag_order = np.asarray(bag_order)
+        starts = bag_offsets[bag_order]
+        bag_sizes = bag_offsets[bag_order + 1] - starts
+        bag_shapes = np.concatenate([[0], np.cumsum(bag_sizes)])
+        # position in bag_index, start of the bag plus the rank of the instance inside the batch bag
+        flat = np.repeat(starts - bag_shapes[:-1], bag_sizes) + np.arange(bag_shapes[-1])
+        return bag_index[flat], bag_shapes
+
+    def gather(self, part, y, ins_order, bag_shapes=None):
+        """
+        InputData of instances ins_order of part ('train' or 'test'), None ins_order takes all instances
+        """
+        features = []
+        for field in ('x', 'pos1', 'pos2', 'len', 'e1', 'e2', 'e1_len', 'e2_len', 'epos'):
+            array = getattr(self, '{}_{}'.format(part, field))
+            features.append(array if ins_order is None else take(array, ins_order))
+        input_data = InputData(y, *features, bag_shapes=bag_shapes)
+        if self.trim_ent:
+            input_data = self.trim_entities(input_data)
+        return dedup_entities(input_data)
+
+    def bucket_orders(self, train_order, batch_size):
+        """
+        split the shuffled train_order into batches of sentences with similar length, the batch order is shuffled
+        """
+        bucket = np.minimum(self.train_len, self.max_sen_len) // self.bucket_width
+        # stable sort keeps the shuffled order inside each bucket
+        train_order = np.asarray(train_order)
+        train_order = train_order[np.argsort(bucket[train_order], kind='mergesort')]
+        batch_num = int(len(train_order) / batch_size)
+        batch_orders = [train_order[i * batch_size: (i + 1) * batch_size] for i in range(batch_num)]
+        random.shuffle(batch_orders)
+        return batch_orders
+
+    def trim_batch(self, batch):
+        """
+        cut the padding of a bucketed batch, keep its longest sentence rounded up to bucket_width
+        """
+        max_len = min(int(np.max(batch.slen)), self.max_sen_len)
+        trim_len = min(max(int(np.ceil(max_len / float(self.bucket_width))), 1) * self.bucket_width, self.max_sen_len)
+        batch.x = batch.x[:, :trim_len]
+        return batch
+
+    def trim_entities(self, batch):
+        """
+        cut the entity padding of a batch, e1 and e2 keep the longest entity of the batch
+        """
+        if batch.e1 is None:
+            return batch
+        max_len = max(int(np.max(batch.e1_len)), int(np.max(batch.e2_len)), 1)
+        trim_len = min(max_len, self.max_ent_len)
+        batch.e1 = batch.e1[:, :trim_len]
+        batch.e2 = batch.e2[:, :trim_len]
+        return batch
+
+    def get_train_batches(self, batch_size, skip=0):
+        """
+        get training data by batch, the first skip batches of the epoch are passed over (resumed epoch)
         """
         if self.multi_ins:
             train_order = range(len(self.train_y_mi))
@@ -179,56 +276,99 @@ class DataLoader(object):
 
         random.shuffle(train_order)
         batch_num = int(len(train_order) / batch_size)
-        for i in range(batch_num):
-            batch_order = train_order[i * batch_size: (i + 1) * batch_size]
-            batch = InputData(select_y[batch_order],
-                              self.train_x[batch_order],
-                              self.train_pos1[batch_order],
-                              self.train_pos2[batch_order],
-                              self.train_len[batch_order],
-                              self.train_e1[batch_order],
-                              self.train_e2[batch_order],
-                              self.train_e1_len[batch_order],
-                              self.train_e2_len[batch_order],
-                              self.train_mask[batch_order]
-                              )
+        if self.bucket_width:
+            batch_orders = self.bucket_orders(train_order, batch_size)
+        else:
+            batch_orders = [train_order[i * batch_size: (i + 1) * batch_size] for i in range(batch_num)]
+        for batch_order in batch_orders[skip:]:
+            if self.mmap_mode is not None:
+                # ascending gather reads the mapped pages in file order
+                batch_order = sorted(batch_order)
+            if self.multi_ins:
+                ins_order, bag_shapes = self.bag_instances(self.train_bag_index, self.train_bag_offsets, batch_order)
+                batch = self.gather('train', select_y[batch_order], ins_order, bag_shapes)
+            else:
+                batch = self.gather('train', select_y[batch_order], batch_order)
+            if self.bucket_width:
+                batch = self.trim_batch(batch)
             yield batch
 
+    def test_size(self):
+        """
+        number of instances, or bags if multi_ins, get_test_batches yields
+        """
+        return len(self.test_y_mi) if self.multi_ins else len(self.test_y)
+
     def get_test_batches(self, batch_size):
         """
-        get testing data by batch
+        get testing data by batch, in order, every instance once, the last batch may be smaller
         """
-        if self.multi_ins:
-            test_order = range(len(self.test_y_mi))
-            select_y = self.test_y_mi
-        else:
-            test_order = range(len(self.test_y))
-            select_y = self.test_y
-
-        random.shuffle(test_order)
-        batch_num = int(len(test_order) / batch_size)
-        for i in range(batch_num):
-            batch_order = test_order[i * batch_size: (i + 1) * batch_size]
-            batch = InputData(select_y[batch_order],
-                              self.test_x[batch_order],
-                              self.test_pos1[batch_order],
-                              self.test_pos2[batch_order],
-                              self.test_len[batch_order],
-                              self.test_e1[batch_order],
-                              self.test_e2[batch_order],
-                              self.test_e1_len[batch_order],
-                              self.test_e2_len[batch_order],
-                              self.test_mask[batch_order]
-                              )
+        select_y = self.test_y_mi if self.multi_ins else self.test_y
+        test_num = self.test_size()
+        for start in range(0, test_num, batch_size):
+            batch_order = np.arange(start, min(start + batch_size, test_num))
+            if self.multi_ins:
+                ins_order, bag_shapes = self.bag_instances(self.test_bag_index, self.test_bag_offsets, batch_order)
+                batch = self.gather('test', select_y[batch_order], ins_order, bag_shapes)
+            else:
+                batch = self.gather('test', select_y[batch_order], batch_order)
             yield batch
 
     def get_test_all(self):
         """
         get all testing data
         """
-        select_y = self.test_y_mi if self.multi_ins else self.test_y
-        test_data = InputData(
-            select_y, self.test_x, self.test_pos1, self.test_pos2, self.test_len,
-            self.test_e1, self.test_e2, self.test_e1_len, self.test_e2_len, self.test_mask
-        )
+        if self.multi_ins:
+            test_data = self.gather('test', self.test_y_mi, self.test_bag_index, self.test_bag_offsets)
+        else:
+            test_data = self.gather('test', self.test_y, None)
         return test_data
+
+
+class DatasetInput(object):
+    """
+    tf.data pipeline over the single-instance training arrays, shuffle, batch and prefetch run in background threads
+    the arrays are copied into the graph once by initialize(), the pipeline only shuffles and batches instance indices
+    and the batch rows are gathered from that copy, batches never go through feed_dict
+    """
+    def __init__(self, data_loader, keys, batch_size, prefetch_num=4):
+        assert not data_loader.multi_ins, 'tf.data input does not support multi-instance bags'
+        arrays = {'y': data_loader.train_y}
+        for key in keys:
+            arrays[key] = getattr(data_loader, 'train_' + key)
+        self.instance_num = len(data_loader.train_y)
+        # the partial last batch is dropped as in DataLoader.get_train_batches
+        self.batch_num = int(self.instance_num / batch_size)
+
+        with tf.name_scope('dataset_input'), tf.device('/cpu:0'):
+            # one copy of each array, local variables so checkpoints do not hold them
+            self.placeholders = {}
+            self.arrays = {}
+            for key, array in arrays.iteritems():
+                self.placeholders[key] = tf.placeholder(array.dtype, array.shape, name='train_{}'.format(key))
+                self.arrays[key] = tf.Variable(self.placeholders[key], trainable=False,
+                                               collections=[tf.GraphKeys.LOCAL_VARIABLES], name='train_{}'.format(key))
+            dataset = tf.data.Dataset.range(self.instance_num).shuffle(buffer_size=self.instance_num)
+            # take and batch before repeat, so every epoch is exactly batch_num full batches, reshuffled each time
+            dataset = dataset.take(self.batch_num * batch_size).batch(batch_size).repeat()
+            dataset = dataset.prefetch(prefetch_num)
+            self.iterator = dataset.make_initializable_iterator()
+            batch_index = self.iterator.get_next()
+            self.tensors = dict((key, tf.gather(self.arrays[key], batch_index)) for key in self.arrays)
+
+        self.init_feed_dict = dict((self.placeholders[key], arrays[key]) for key in arrays)
+
+    def initialize(self, session):
+        """
+        copy the training arrays into the graph, needed once per session
+        """
+        session.run([array.initializer for array in self.arrays.itervalues()] + [self.iterator.initializer],
+                    feed_dict=self.init_feed_dict)
+
+    def get_train_batches(self, skip=0):
+        """
+        one epoch of steps, the model reads the batch from the iterator so there is no data to yield
+        a resumed epoch only runs its remaining batch_num - skip steps
+        """
+        for _ in range(skip, self.batch_num):
+            yield None
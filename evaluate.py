@@ -7,21 +7,28 @@ from sklearn.metrics import precision_recall_curve
 from sklearn.metrics import average_precision_score
 
 
-def get_confusion_matrix(pred, answer):
+def to_labels(answer):
     """
-    get confusion_matrix
+    integer labels of answers, one-hot rows are reduced by argmax
     """
-    answer = list(answer)
-    rel_num = len(answer[0])
-    answer = [np.argmax(i) for i in answer]
-    pred = list(pred)
+    answer = np.asarray(answer)
+    return np.argmax(answer, axis=1) if answer.ndim == 2 else answer
 
-    confusion_matrix = np.zeros([rel_num, rel_num])
 
-    for res in zip(answer, pred):
-        confusion_matrix[res[0], res[1]] += 1
+def get_confusion_matrix(pred, answer, rel_num=None):
+    """
+    get confusion_matrix, rows are answers and columns predictions
+    answer is one-hot rows or integer labels, integer labels need rel_num
+    """
+    answer = np.asarray(answer)
+    if answer.ndim == 2:
+        rel_num = answer.shape[1]
+    assert rel_num is not None, 'rel_num is needed for integer labels'
+    answer = to_labels(answer).astype(np.int64)
+    pred = np.asarray(pred, dtype=np.int64)
 
-    return confusion_matrix
+    confusion_matrix = np.bincount(answer * rel_num + pred, minlength=rel_num * rel_num)
+    return confusion_matrix.reshape([rel_num, rel_num])
 
 
 def static_cm(confusion_matrix, use_neg=True):
@@ -30,16 +37,14 @@ def static_cm(confusion_matrix, use_neg=True):
     """
     static_res = []
     rel_num = confusion_matrix.shape[0]
-    tp_all, tp_fn_all, tp_fp_all = 0, 0, 0
-    for i in range(rel_num):
-        if (not use_neg) and i == 0:
-            continue
-        tp_fp = sum(confusion_matrix[:, i])
-        tp_fn = sum(confusion_matrix[i, :])
-        tp = confusion_matrix[i, i]
-        tp_all += tp
-        tp_fp_all += tp_fp
-        tp_fn_all += tp_fn
+    confusion_matrix = confusion_matrix.astype(np.float64)
+    tp_fp_rel = confusion_matrix.sum(axis=0)
+    tp_fn_rel = confusion_matrix.sum(axis=1)
+    tp_rel = np.diag(confusion_matrix)
+    rels = np.arange(0 if use_neg else 1, rel_num)
+    tp_all, tp_fn_all, tp_fp_all = tp_rel[rels].sum(), tp_fn_rel[rels].sum(), tp_fp_rel[rels].sum()
+    for i in rels:
+        tp_fp, tp_fn, tp = tp_fp_rel[i], tp_fn_rel[i], tp_rel[i]
         p = float(tp) / float(tp_fp) if tp_fp else 0
         r = float(tp) / float(tp_fn) if tp_fn else 0
         f1 = (2 * p * r) / (p + r) if p and r else 0
@@ -64,36 +69,58 @@ def static_cm(confusion_matrix, use_neg=True):
     return static_res, p_r_f1_macro, p_r_f1_micro
 
 
-def get_p_r_f1(pred, answer, use_neg=True):
+def get_p_r_f1(pred, answer, use_neg=True, rel_num=None):
     """
     get p, r, f1 by give prediction and answer, use_neg indicated whether p, r, f of NA relation is counted in Macro-avg
+    rel_num is the number of relations, needed when answer is integer labels
     """
     assert len(pred) == len(answer)
-    confusion_matrix = get_confusion_matrix(pred, answer)
+    confusion_matrix = get_confusion_matrix(pred, answer, rel_num)
     p_r_f1_list, p_r_f1_macro, p_r_f1_micro = static_cm(confusion_matrix, use_neg)
 
     return p_r_f1_list, p_r_f1_macro, p_r_f1_micro
 
 
-def get_wrong_ins(pred, ans, sen, p1, p2, x2id, id2x, id2rel, use_neg=True):
+class MetricsAccumulator(object):
     """
-    show wrong labeled instance
+    confusion matrix updated batch by batch, memory is rel_num ** 2 whatever the number of instances
+    """
+    def __init__(self, rel_num, use_neg=True):
+        self.rel_num = rel_num
+        self.use_neg = use_neg
+        self.confusion_matrix = np.zeros([rel_num, rel_num], dtype=np.int64)
+
+    def update(self, pred, answer):
+        """
+        add a batch of predictions and answers (one-hot rows or integer labels)
+        """
+        self.confusion_matrix += get_confusion_matrix(pred, answer, self.rel_num)
+
+    def __len__(self):
+        return int(self.confusion_matrix.sum())
+
+    def result(self):
+        """
+        same as get_p_r_f1 over every instance added
+        """
+        return static_cm(self.confusion_matrix, self.use_neg)
+
+
+def get_wrong_ins(pred, ans, sen, e1p, e2p, x2id, id2x, id2rel, use_neg=True):
+    """
+    show wrong labeled instance, e1p and e2p are the entity positions
     """
     assert len(pred) == len(ans)
     pred = np.array(pred)
-    answer = np.array([np.argmax(i) for i in ans])
+    answer = to_labels(ans)
     wrong_labeled_ins = np.asarray(sen)[pred != answer]
     wrong_labeled_lab = np.asarray(answer)[pred != answer]
     wrong_labeled_pre = np.asarray(pred)[pred != answer]
 
+    # entities cut off with the sentence are shown as its last token
     max_sen_len = len(wrong_labeled_ins[0])
-    # e1 pos
-    wrong_labeled_pos1 = np.asarray(p1)[pred != answer]
-    wrong_labeled_e1p = max_sen_len - wrong_labeled_pos1 + 1
-
-    # e2 pos
-    wrong_labeled_pos2 = np.asarray(p2)[pred != answer]
-    wrong_labeled_e2p = max_sen_len - wrong_labeled_pos2 + 1
+    wrong_labeled_e1p = np.minimum(np.asarray(e1p, dtype=np.int64)[pred != answer], max_sen_len - 1)
+    wrong_labeled_e2p = np.minimum(np.asarray(e2p, dtype=np.int64)[pred != answer], max_sen_len - 1)
 
     wrong_ins = []
     wrong_ins_e1 = []
@@ -123,8 +150,11 @@ def get_wrong_ins(pred, ans, sen, p1, p2, x2id, id2x, id2rel, use_neg=True):
 
 def save_prcurve(prob, answer, model_name, save_fn, use_neg=True):
     """
-    save prc curve
+    save prc curve, answer is one-hot rows or integer labels
     """
+    answer = np.asarray(answer)
+    if answer.ndim == 1:
+        answer = np.eye(np.shape(prob)[1], dtype=np.int32)[answer]
     if not use_neg:
         prob_dn = []
         ans_dn = []
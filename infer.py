@@ -0,0 +1,348 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import argparse
+import cPickle
+from collections import OrderedDict
+import numpy as np
+import tensorflow as tf
+from data_loader import InputData, model_inputs, s_ins_files, compute_entity_pos, dedup_entities, label_ids
+from models import model_tensors
+from main import ms_dict, m_dict
+
+# model input placeholder of each feature
+feature_inputs = {
+    'x': 'input_sen',
+    'len': 'input_len',
+    'e1': 'input_e1',
+    'e2': 'input_e2',
+    'e1_len': 'input_e1_len',
+    'e2_len': 'input_e2_len',
+    'epos': 'input_epos',
+    'ent': 'input_ent',
+    'ent_len': 'input_ent_len',
+    'e1_idx': 'input_e1_idx',
+    'e2_idx': 'input_e2_idx'
+}
+
+# distinct entities of a batch, fed in place of the entity features so each one is encoded once
+ent_fields = ['ent', 'ent_len', 'e1_idx', 'e2_idx']
+
+
+def model_outputs(model):
+    """
+    class label and probability tensors of a single-instance model, the ones its evaluate fetches
+    """
+    return model_tensors(model)[1:]
+
+
+class EntityCache(object):
+    """
+    least recently used entity encodings keyed by the entity id sequence, kept across runs in cache_file
+    """
+    def __init__(self, capacity, cache_file=None):
+        self.capacity = capacity
+        self.cache_file = cache_file
+        self.encodings = OrderedDict()
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                self.encodings = cPickle.load(f)
+            while len(self.encodings) > capacity:
+                self.encodings.popitem(last=False)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def get(self, key):
+        value = self.encodings.pop(key, None)
+        if value is not None:
+            # most recently used entries are at the end
+            self.encodings[key] = value
+        return value
+
+    def put(self, key, value):
+        self.encodings.pop(key, None)
+        self.encodings[key] = value
+        if len(self.encodings) > self.capacity:
+            self.encodings.popitem(last=False)
+
+    def save(self):
+        if self.cache_file is not None:
+            with open(self.cache_file, 'wb') as f:
+                cPickle.dump(self.encodings, f, cPickle.HIGHEST_PROTOCOL)
+
+
+class Predictor(object):
+    """
+    restore a trained model from its result directory result/<model>/<level>/<time_id> and score new instances
+    entity models keep up to entity_cache_size entity encodings in <model_dir>/entity_cache.pkl, 0 disables it
+    """
+    def __init__(self, model_dir, data_dir='./data', entity_cache_size=0):
+        # model and feature level come from the result directory
+        model_dir = os.path.normpath(model_dir)
+        level_dir = os.path.dirname(model_dir)
+        class_name = os.path.basename(os.path.dirname(level_dir))
+        self.c_feature = os.path.basename(level_dir) == 'c_level'
+        model_names = dict((m.__name__, name) for name, m in m_dict.iteritems())
+        self.model_name = model_names[class_name]
+        assert self.model_name != 'birnn_mi', 'inference does not support multi-instance bags'
+
+        # the embedding values are restored from the checkpoint, the models only need their shapes
+        if self.c_feature:
+            embedding = np.load('{}/char_vec.npy'.format(data_dir), mmap_mode='r')
+        else:
+            embedding = np.load('{}/word_vec.npy'.format(data_dir), mmap_mode='r')
+        # entities use character representation
+        model_kwargs = {}
+        if 'e1' in model_inputs[self.model_name]:
+            model_kwargs['ent_embedding'] = np.load('{}/char_vec.npy'.format(data_dir), mmap_mode='r')
+        with open('./origin_data/idx2rel.pkl', 'rb') as f:
+            self.id2rel = cPickle.load(f)
+
+        # setting saved by training, results without it use the default setting and the training data lengths
+        setting_file = os.path.join(model_dir, 'model_setting.pkl')
+        if os.path.exists(setting_file):
+            with open(setting_file, 'rb') as f:
+                self.model_setting = cPickle.load(f)
+        else:
+            self.model_setting = ms_dict[self.model_name]()
+            level = 1 if self.c_feature else 0
+            self.model_setting.sen_len = np.load(
+                '{}/s-ins/test_{}.npy'.format(data_dir, s_ins_files['x'][level]), mmap_mode='r').shape[1]
+            self.model_setting.ent_len = np.load(
+                '{}/s-ins/test_{}.npy'.format(data_dir, s_ins_files['e1'][level]), mmap_mode='r').shape[1]
+            self.model_setting.pos_max_len = self.model_setting.sen_len
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.model = m_dict[self.model_name](embedding, self.model_setting, **model_kwargs)
+            self.session = tf.Session(graph=self.graph)
+            tf.train.Saver().restore(self.session, os.path.join(model_dir, 'model_saved'))
+
+        self.entity_cache = None
+        if entity_cache_size > 0 and hasattr(self.model, 'ent_encoding'):
+            self.entity_cache = EntityCache(entity_cache_size, os.path.join(model_dir, 'entity_cache.pkl'))
+
+    def predict(self, input_data):
+        """
+        predicted label and probabilities of each instance of input_data
+        """
+        if self.entity_cache is None:
+            _, label_pred, label_prob = self.model.evaluate(self.session, input_data)
+            return label_pred, label_prob
+        # cached entity encodings are fed in place of the entity encoder output
+        feed_dict = self.model.get_feed_dict(input_data, 1)
+        feed_dict[self.model.ent_encoding] = self.encode_entities(input_data)
+        label_pred, label_prob = self.session.run(list(model_outputs(self.model)), feed_dict=feed_dict)
+        return label_pred, label_prob
+
+    def encode_entities(self, input_data):
+        """
+        encoding of each distinct entity of input_data, only the ones missing from the cache run the entity encoder
+        """
+        if input_data.ent_len is None:
+            keys = [tuple(row) for row in input_data.ent.tolist()]
+        else:
+            keys = [tuple(row[:n]) for row, n in zip(input_data.ent.tolist(), input_data.ent_len.tolist())]
+        encodings = [self.entity_cache.get(key) for key in keys]
+        missing = [i for i, value in enumerate(encodings) if value is None]
+        if missing:
+            feed_dict = {self.model.input_ent: input_data.ent[missing], self.model.dropout_keep_rate: 1}
+            if input_data.ent_len is not None:
+                feed_dict[self.model.input_ent_len] = input_data.ent_len[missing]
+            for i, value in zip(missing, self.session.run(self.model.ent_encoding, feed_dict=feed_dict)):
+                encodings[i] = value
+                self.entity_cache.put(keys[i], value)
+        return np.stack(encodings)
+
+    def load_features(self, input_dir, part):
+        """
+        memory map the preprocessed s-ins arrays {input_dir}/{part}_*.npy the model needs, y is optional
+        """
+        fields = set(model_inputs[self.model_name]) | {'x'}
+        # older preprocessing wrote position matrices instead of the entity offsets
+        level = 1 if self.c_feature else 0
+        if 'epos' in fields and not os.path.exists('{}/{}_{}.npy'.format(input_dir, part, s_ins_files['epos'][level])):
+            fields = (fields - {'epos'}) | {'pos1', 'pos2'}
+        features = {}
+        for field in fields | {'y'}:
+            fn = '{}/{}_{}.npy'.format(input_dir, part, s_ins_files[field][level])
+            if field != 'y' or os.path.exists(fn):
+                features[field] = np.load(fn, mmap_mode='r')
+        if 'y' in features:
+            features['y'] = label_ids(features['y'])
+        return features
+
+    def get_batch(self, features, start, end):
+        """
+        InputData of instances [start:end], instances without answers get all zero labels
+        """
+        batch = dict((field, np.asarray(array[start:end])) for field, array in features.iteritems())
+        if 'y' not in batch:
+            batch['y'] = np.zeros([len(batch['x'])], dtype=np.int32)
+        if 'pos1' in batch:
+            batch['epos'] = compute_entity_pos(batch.pop('pos1'), batch.pop('pos2'))
+        return dedup_entities(InputData(
+            batch['y'], batch['x'], None, None, batch.get('len'),
+            batch.get('e1'), batch.get('e2'), batch.get('e1_len'), batch.get('e2_len'), batch.get('epos')
+        ))
+
+    def predict_file(self, input_dir, part, out_dir, batch_size=4096):
+        """
+        stream all instances of {input_dir}/{part}_*.npy through the model in order, batch by batch
+        results are written as they come, {part}_pred.txt has the index, label id, relation and its probability
+        of each instance, {part}_prob.npy has all probabilities
+        """
+        features = self.load_features(input_dir, part)
+        ins_num = len(features['x'])
+        prob_all = np.lib.format.open_memmap(
+            os.path.join(out_dir, '{}_prob.npy'.format(part)), mode='w+', dtype=np.float32,
+            shape=(ins_num, self.model_setting.class_num)
+        )
+        with open(os.path.join(out_dir, '{}_pred.txt'.format(part)), 'w') as f:
+            for start in range(0, ins_num, batch_size):
+                label_pred, label_prob = self.predict(self.get_batch(features, start, start + batch_size))
+                prob_all[start: start + len(label_pred)] = label_prob
+                for idx in range(len(label_pred)):
+                    label = label_pred[idx]
+                    f.write('{}\t{}\t{}\t{:.6f}\n'.format(
+                        start + idx, label, self.id2rel[label], label_prob[idx][label]
+                    ))
+                print 'scored {}/{} instances'.format(start + len(label_pred), ins_num)
+        prob_all.flush()
+        del prob_all
+
+    def export(self, graph_file):
+        """
+        write an inference only graph, variables folded to constants, dropout keep rate fixed to 1.0
+        loss, optimizer, summaries and the label placeholder are dropped as the outputs do not depend on them
+        the tensor names of inputs and outputs are pickled to graph_file + '.pkl' for FrozenPredictor
+        """
+        with self.graph.as_default():
+            label, prob = model_outputs(self.model)
+            tf.identity(label, name='output_label')
+            tf.identity(prob, name='output_prob')
+            graph_def = tf.graph_util.convert_variables_to_constants(
+                self.session, self.graph.as_graph_def(), ['output_label', 'output_prob']
+            )
+
+        # replace the dropout placeholder by a constant
+        with tf.Graph().as_default() as graph:
+            input_map = {}
+            if self.model.dropout_keep_rate.op.name in set(node.name for node in graph_def.node):
+                input_map[self.model.dropout_keep_rate.name] = tf.constant(1.0, name='dropout_keep_rate_inference')
+            tf.import_graph_def(graph_def, input_map=input_map, name='')
+            graph_def = tf.graph_util.extract_sub_graph(graph.as_graph_def(), ['output_label', 'output_prob'])
+
+        # inputs the outputs still depend on, entity models take the distinct entities instead of e1 and e2
+        node_names = set(node.name for node in graph_def.node)
+        fields = model_inputs[self.model_name] + ['x']
+        if hasattr(self.model, 'input_ent'):
+            fields = [field for field in fields if field not in ('e1', 'e2', 'e1_len', 'e2_len')] + ent_fields
+        inputs = {}
+        for field in fields:
+            tensor = getattr(self.model, feature_inputs[field], None)
+            if tensor is not None and tensor.op.name in node_names:
+                inputs[field] = tensor.name
+        signature = {
+            'model_name': self.model_name,
+            'c_feature': self.c_feature,
+            'model_setting': self.model_setting,
+            'inputs': inputs,
+            'outputs': ('output_label:0', 'output_prob:0')
+        }
+        with tf.gfile.GFile(graph_file, 'wb') as f:
+            f.write(graph_def.SerializeToString())
+        with open(graph_file + '.pkl', 'wb') as f:
+            cPickle.dump(signature, f)
+
+    def close(self):
+        if self.entity_cache is not None:
+            self.entity_cache.save()
+        self.session.close()
+
+
+class FrozenPredictor(Predictor):
+    """
+    score instances with a graph written by Predictor.export, no checkpoint or embedding file is needed
+    """
+    def __init__(self, graph_file):
+        with open(graph_file + '.pkl', 'rb') as f:
+            signature = cPickle.load(f)
+        self.model_name = signature['model_name']
+        self.c_feature = signature['c_feature']
+        self.model_setting = signature['model_setting']
+        self.entity_cache = None
+        with open('./origin_data/idx2rel.pkl', 'rb') as f:
+            self.id2rel = cPickle.load(f)
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(graph_file, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.session = tf.Session(graph=self.graph)
+        self.inputs = dict((field, self.graph.get_tensor_by_name(name))
+                           for field, name in signature['inputs'].iteritems())
+        self.outputs = [self.graph.get_tensor_by_name(name) for name in signature['outputs']]
+
+    def predict(self, input_data):
+        """
+        predicted label and probabilities of each instance of input_data, only the model inputs are fed
+        """
+        feed_dict = {}
+        for field, tensor in self.inputs.iteritems():
+            feed_dict[tensor] = getattr(input_data, 'slen' if field == 'len' else field)
+        label_pred, label_prob = self.session.run(self.outputs, feed_dict=feed_dict)
+        return label_pred, label_prob
+
+
+def main():
+    """
+    score preprocessed instances with a trained model
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', type=str, default=None,
+                        help='result directory of a trained model, result/<model>/<level>/<time_id>')
+    parser.add_argument('--graph', type=str, default=None, help='score with a graph written by --export instead')
+    parser.add_argument('--export', action='store_true',
+                        help='write the inference graph of model_dir to <out_dir>/frozen_graph.pb and exit')
+    parser.add_argument('--data_dir', type=str, default='./data', help='directory of the embeddings')
+    parser.add_argument('--input_dir', type=str, default='./data/s-ins', help='directory of the preprocessed input')
+    parser.add_argument('--part', type=str, default='test', help='prefix of the input files, <part>_<feature>.npy')
+    parser.add_argument('--out_dir', type=str, default=None, help='output directory, default is model_dir')
+    parser.add_argument('--batch_size', type=int, default=4096, help='batch size')
+    parser.add_argument('--entity_cache_size', type=int, default=0,
+                        help='entity encodings kept in <model_dir>/entity_cache.pkl by entity models, 0 disables it')
+    args = parser.parse_args()
+    if (args.model_dir is None) == (args.graph is None):
+        parser.error('give one of --model_dir and --graph')
+    if args.export and args.model_dir is None:
+        parser.error('--export needs --model_dir')
+
+    out_dir = args.out_dir or args.model_dir or os.path.dirname(os.path.abspath(args.graph))
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    if args.graph is not None:
+        print 'loading graph {}...'.format(args.graph)
+        predictor = FrozenPredictor(args.graph)
+    else:
+        print 'restoring model from {}...'.format(args.model_dir)
+        predictor = Predictor(args.model_dir, args.data_dir, args.entity_cache_size)
+
+    if args.export:
+        graph_file = os.path.join(out_dir, 'frozen_graph.pb')
+        print 'exporting inference graph to {}...'.format(graph_file)
+        predictor.export(graph_file)
+        predictor.close()
+        return
+
+    print 'scoring {}/{}...'.format(args.input_dir, args.part)
+    predictor.predict_file(args.input_dir, args.part, out_dir, args.batch_size)
+    predictor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,82 +1,72 @@
 # -*- encoding: utf-8 -*-
 # Created by han on 17-6-18
+import os
+import argparse
+import hashlib
+import tempfile
 import numpy as np
 import pandas as pd
 import cPickle
 from datetime import datetime
+from multiprocessing import Pool
+from vocab import Vocab, save_vocab, vocab_exists
 
 
 def get_word_emb():
     """
-    get word embedding matrix and dict of word to embedding index
-    :return: dict of word to embedding index
+    get word embedding matrix and vocabulary of word to embedding index
+    the vocabulary store ./data/word_*.npy is only rebuilt if the word vectors are newer than it
+    :return: vocabulary of word to embedding index
     """
+    source = './origin_data/vectors/word_vec_50.pkl'
+    if vocab_exists('./data/word', source):
+        print 'loading word vocabulary...'
+        return Vocab('./data/word')
+
     # word embedding
     print 'reading word embedding data...'
-    vec = []
-    word2id = {}
-    with open('./origin_data/vectors/word_vec_50.pkl', 'rb') as f:
+    with open(source, 'rb') as f:
         word2vec = cPickle.load(f)
-    for k in sorted(word2vec.keys()):
-        word2id[k] = len(word2id)
-        vec.append(word2vec[k])
-
-    word2id[u'_UNK'] = len(word2id)
-    word2id[u'_BLANK'] = len(word2id)
+    words = sorted(word2vec.keys())
+    vec = [word2vec[k] for k in words]
+    words += [u'_UNK', u'_BLANK']
 
     dim = len(vec[0]) if vec else 50
     vec.append(np.random.normal(size=dim, loc=0, scale=0.05))
     vec.append(np.random.normal(size=dim, loc=0, scale=0.05))
     vec = np.array(vec, dtype=np.float32)
-    np.save('./data/word_vec.npy', vec)
+    save_vocab('./data/word', words, vec)
 
-    with open('./data/word2id.pkl', 'wb') as f:
-        cPickle.dump(word2id, f)
-
-    id2word = {}
-    for word, idx in word2id.iteritems():
-        id2word[idx] = word
-    with open('./data/id2word.pkl', 'wb') as f:
-        cPickle.dump(id2word, f)
-
-    return word2id
+    return Vocab('./data/word')
 
 
 def get_char_emb():
     """
-    get character embedding matrix and dict of character to embedding index
-    :return: dict of character to embedding index
+    get character embedding matrix and vocabulary of character to embedding index
+    the vocabulary store ./data/char_*.npy is only rebuilt if the character vectors are newer than it
+    :return: vocabulary of character to embedding index
     """
+    source = './origin_data/vectors/char_vec_50.pkl'
+    if vocab_exists('./data/char', source):
+        print 'loading character vocabulary...'
+        return Vocab('./data/char')
+
     # character level embedding
     print 'reading character embedding data...'
-    c_vec = []
-    char2id = {}
-    with open('./origin_data/vectors/char_vec_50.pkl', 'rb') as f:
+    with open(source, 'rb') as f:
         char2vec = cPickle.load(f)
-    for k in sorted(char2vec.keys()):
-        char2id[k] = len(char2id)
-        c_vec.append(char2vec[k])
-
-    char2id[u'_UNK'] = len(char2id)
-    char2id[u'_BLANK'] = len(char2id)
+    chars = sorted(char2vec.keys())
+    c_vec = [char2vec[k] for k in chars]
+    chars += [u'_UNK', u'_BLANK']
 
     c_dim = 50
     c_vec.append(np.random.normal(size=c_dim, loc=0, scale=0.05))
     c_vec.append(np.random.normal(size=c_dim, loc=0, scale=0.05))
     c_vec = np.asarray(c_vec, dtype=np.float)
     # save vec matrix
-    np.save('./data/char_vec.npy', c_vec)
-
-    with open('./data/char2id.pkl', 'wb') as f:
-        cPickle.dump(char2id, f)
+    save_vocab('./data/char', chars, c_vec)
 
-    id2char = {}
-    for char, idx in char2id.iteritems():
-        id2char[idx] = char
-    with open('./data/id2char.pkl', 'wb') as f:
-        cPickle.dump(id2char, f)
-
-    return char2id
+    return Vocab('./data/char')
 
 
 def get_rel_idx():
@@ -184,31 +174,224 @@ def sentence2idx(sentence, idx_dict):
     return idx_list
 
 
-def get_data_features(data_file, word2id, char2id, rel2id):
+def narrow_dtype(max_value):
     """
-    restructure data from original data file, get useful features
-    :return: restructured data
+    narrowest unsigned integer dtype holding 0..max_value, the loader keeps it and the graph widens it to int32
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def len_array(seq_lens):
+    """
+    sentence or entity lengths, or entity offsets, as uint16, larger ones are clipped as models only use them up to
+    the pad length
+    """
+    return np.minimum(seq_lens, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+def pad_idx(sequences, vocab, pad_len, dtype=np.int64):
+    """
+    translate token sequences to index by one vocabulary lookup, cut or pad them with _BLANK to pad_len
+    :return: index matrix, [sequence number, pad_len]
+    """
+    sequences = [seq[:pad_len] for seq in sequences]
+    seq_len = np.asarray([len(seq) for seq in sequences], dtype=np.int64)
+    padded = np.full([len(sequences), pad_len], vocab.blank_id, dtype=dtype)
+    # row and column of each token in the padded matrix
+    rows = np.repeat(np.arange(len(sequences)), seq_len)
+    cols = np.arange(seq_len.sum()) - np.repeat(np.cumsum(seq_len) - seq_len, seq_len)
+    padded[rows, cols] = vocab.lookup([token for seq in sequences for token in seq])
+    return padded
+
+
+# s-ins file names of the features in feature_ins and feature_ins_c, epos is the offset of entity 1 and entity 2,
+# the models compute the relative position features from it
+ins_files = ('word', 'len', 'epos', 'e1', 'e2', 'e1_len', 'e2_len')
+ins_files_c = ('char', 'len_c', 'epos_c', 'e1_c', 'e2_c', 'e1_len_c', 'e2_len_c')
+
+# dicts of the preprocessing workers, set once per process by init_worker
+worker_dicts = {}
+
+
+# entity pad lengths (by word, by character) of the original preprocessing
+default_ent_lens = (80, 116)
+
+
+def init_worker(word2id, char2id, rel2id, ent_lens=default_ent_lens):
+    """
+    keep the dicts in the worker process, so they are not sent with every relation
+    """
+    worker_dicts['word2id'] = word2id
+    worker_dicts['char2id'] = char2id
+    worker_dicts['rel2id'] = rel2id
+    worker_dicts['ent_lens'] = ent_lens
+
+
+def get_rel_features(task):
+    """
+    features of all instances of one relation in the original data file
+    :param task: (data file, relation index)
+    :return: entity pairs, features by word, features by character
+    """
+    data_file, rel = task
+    data_rel = read_rel(data_file, rel)
+    feature_ins, feature_ins_c = get_chunk_features(data_rel)
+    return zip(data_rel['uri1'].values, data_rel['uri2'].values), feature_ins, feature_ins_c
+
+
+def save_rel_features(task):
+    """
+    streaming get_rel_features, features of every chunk_size instances are saved to tmp_dir as
+    {rel}_{chunk}_{file name}.npy, so the worker only holds one chunk of features
+    a relation whose fingerprint equals old_fingerprint is not processed, its entity pairs are None
+    :param task: (data file, relation index, tmp_dir, chunk_size, old_fingerprint)
+    :return: entity pairs, chunk number, fingerprint
+    """
+    data_file, rel, tmp_dir, chunk_size, old_fingerprint = task
+    data_rel = read_rel(data_file, rel)
+    fingerprint = rel_fingerprint(data_rel)
+    if fingerprint == old_fingerprint:
+        return None, 0, fingerprint
+    chunk_num = 0
+    for start in range(0, len(data_rel), chunk_size):
+        feature_ins, feature_ins_c = get_chunk_features(data_rel.iloc[start: start + chunk_size])
+        for fn, array in zip(ins_files + ins_files_c, feature_ins + feature_ins_c):
+            np.save(os.path.join(tmp_dir, '{}_{}_{}.npy'.format(rel, chunk_num, fn)), array)
+        chunk_num += 1
+    return zip(data_rel['uri1'].values, data_rel['uri2'].values), chunk_num, fingerprint
+
+
+def rel_fingerprint(data_rel):
+    """
+    content fingerprint of the instances of one relation
+    """
+    return hashlib.md5(cPickle.dumps(data_rel, 2)).hexdigest()
+
+
+def read_rel(data_file, rel):
+    """
+    instances of one relation in the original data file
+    """
+    data_rel = pd.read_hdf(data_file, '/' + str(rel))
+    if rel != 0:
+        rel2id = worker_dicts['rel2id']
+        for relation in data_rel['rel'].values:
+            assert rel == rel2id[relation]
+    return data_rel
+
+
+def get_chunk_features(data_rel):
+    """
+    features of the instances of data_rel
+    :return: features by word, features by character
     """
+    word2id, char2id = worker_dicts['word2id'], worker_dicts['char2id']
+
     # length of sentence is 100
     fixlen_w = 100
-    # max length of position embedding is 100 (-100~+100)
-    maxlen_w = 100
     # length of sentence by character is 330
     fixlen_c = 330
-    # max length of position embedding by character is 330 (-330~+330)
-    maxlen_c = 330
-    # max length of entity is 80
-    max_ent_len_w = 80
-    # max length of entity by character is 116
-    max_ent_len_c = 116
-
-    # organize data by instance
-    sen_all, sen_pos1_all, sen_pos2_all, sen_len_all = [], [], [], []
-    e1_all, e2_all, e1_len_all, e2_len_all = [], [], [], []
-    sen_all_c, sen_pos1_all_c, sen_pos2_all_c, sen_len_all_c = [], [], [], []
-    e1_all_c, e2_all_c, e1_len_all_c, e2_len_all_c = [], [], [], []
-    label_all = []
+    # max length of entity by word and by character, 80 and 116 unless set from the data
+    max_ent_len_w, max_ent_len_c = worker_dicts['ent_lens']
+
+    sentences, e1_all, e2_all = [], [], []
+    sentences_c, e1_all_c, e2_all_c = [], [], []
+    en1pos_all, en2pos_all, sen_len_all = [], [], []
+    en1pos_all_c, en2pos_all_c, sen_len_all_c = [], [], []
+    for sentence, en1pos, en2pos in zip(data_rel['st_seg'].values, data_rel['ent1_p2'].values,
+                                        data_rel['ent2_p2'].values):
+        sentences.append([w.decode('utf8') for w in sentence])
+        e1_all.append([w.decode('utf8') for w in sentence[en1pos].split('_con_')])
+        e2_all.append([w.decode('utf8') for w in sentence[en2pos].split('_con_')])
+        en1pos_all.append(en1pos)
+        en2pos_all.append(en2pos)
+        sen_len_all.append(len(sentence))
+
+        sentence_c, (en1pos_c, en2pos_c), sen_len_c, e1_c, e2_c = feature_word2char(sentence, en1pos, en2pos)
+        sentences_c.append(sentence_c)
+        e1_all_c.append(e1_c)
+        e2_all_c.append(e2_c)
+        en1pos_all_c.append(en1pos_c)
+        en2pos_all_c.append(en2pos_c)
+        sen_len_all_c.append(sen_len_c)
+
+    # narrowest dtypes, fixed by the vocabulary and pad lengths so every chunk has the same ones
+    word_dtype = narrow_dtype(len(word2id) - 1)
+    char_dtype = narrow_dtype(len(char2id) - 1)
+    feature_ins = (
+        pad_idx(sentences, word2id, fixlen_w, word_dtype),
+        len_array(sen_len_all),
+        len_array(np.stack([en1pos_all, en2pos_all], 1)),
+        pad_idx(e1_all, word2id, max_ent_len_w, word_dtype),
+        pad_idx(e2_all, word2id, max_ent_len_w, word_dtype),
+        len_array([len(e) for e in e1_all]),
+        len_array([len(e) for e in e2_all])
+    )
+    feature_ins_c = (
+        pad_idx(sentences_c, char2id, fixlen_c, char_dtype),
+        len_array(sen_len_all_c),
+        len_array(np.stack([en1pos_all_c, en2pos_all_c], 1)),
+        pad_idx(e1_all_c, char2id, max_ent_len_c, char_dtype),
+        pad_idx(e2_all_c, char2id, max_ent_len_c, char_dtype),
+        len_array([len(e) for e in e1_all_c]),
+        len_array([len(e) for e in e2_all_c])
+    )
+    return feature_ins, feature_ins_c
+
+
+def get_rel_entity_lens(task):
+    """
+    word and character length of both entities of every instance of one relation
+    :param task: (data file, relation index)
+    """
+    data_file, rel = task
+    data_rel = pd.read_hdf(data_file, '/' + str(rel))
+    lens_w, lens_c = [], []
+    for sentence, en1pos, en2pos in zip(data_rel['st_seg'].values, data_rel['ent1_p2'].values,
+                                        data_rel['ent2_p2'].values):
+        for pos in (en1pos, en2pos):
+            words = sentence[pos].split('_con_')
+            lens_w.append(len(words))
+            lens_c.append(len(''.join(words).decode('utf8')))
+    return lens_w, lens_c
+
+
+def get_ent_lens(data_files, quantile=1.0, process_num=None):
+    """
+    entity pad lengths (by word, by character) covering the quantile of the entities in data_files,
+    1.0 keeps the longest entity, longer entities are cut
+    """
+    tasks = [(data_file, rel) for data_file in data_files for rel in get_relations(data_file)]
+    pool = Pool(process_num)
+    rel_lens = pool.map(get_rel_entity_lens, tasks)
+    pool.close()
+    pool.join()
+    ent_lens = []
+    for i in range(2):
+        lens = np.concatenate([np.asarray(lens[i], dtype=np.int64) for lens in rel_lens])
+        ent_lens.append(max(int(np.ceil(np.percentile(lens, quantile * 100))), 1))
+    return tuple(ent_lens)
+
+
+def get_relations(data_file):
+    """
+    relation indexes in the original data file, in order
+    """
+    data_train = pd.HDFStore(data_file)
+    rels = sorted(int(i.replace('/', '')) for i in data_train.keys())
+    data_train.close()
+    return rels
+
 
+def organize_entity_pairs(rels, rel_entity_pairs, rel_num):
+    """
+    organize instance index by entity pair and label, instances are indexed in relation order
+    :param rel_entity_pairs: entity pair of each instance of each relation
+    :return: data organized by entity pair
+    """
     # organize data by entity pair
     # {entity pair1: [
     #                   [[label1-sentence 1 index],[label1-sentence 2 index]...],
@@ -220,35 +403,15 @@ def get_data_features(data_file, word2id, char2id, rel2id):
     # {entity pair: [label1,label2,...]} the label is one-hot vector
     ans = {}
 
-    print datetime.now(), 'processing {}...'.format(data_file)
     all_index = 0
-    data_train = pd.HDFStore(data_file)
     ep_counter_all = 0
-    for rel in sorted(int(i.replace('/', '')) for i in data_train.keys()):
-        data_rel = data_train['/' + str(rel)]
-        ep_counter_r, ins_counter_r = 0, 0
-        ep_set_r = set()
-        for _, ins in data_rel.iterrows():
-            ins_counter_r += 1
-            # get entity name
-            en1 = ins['uri1']
-            en2 = ins['uri2']
-            relation = ins['rel']
-            if rel != 0:
-                assert rel == rel2id[relation]
-
-            # put the same entity pair sentences into a dict
-            tup = (en1, en2)
-            if tup not in ep_set_r:
-                ep_counter_r += 1
-                ep_set_r.add(tup)
+    for rel, entity_pairs in zip(rels, rel_entity_pairs):
+        ep_counter_r = len(set(entity_pairs))
+        for tup in entity_pairs:
             # label one-hot
-            label = [0] * len(rel2id)
+            label = [0] * rel_num
             label[rel] = 1
 
-            # single-instance
-            label_all.append(label)
-
             # multi-instance
             if tup not in sen:
                 ep_counter_all += 1
@@ -264,110 +427,150 @@ def get_data_features(data_file, word2id, char2id, rel2id):
                     ans[tup].append(label)
                     label_tag = len(ans[tup]) - 1
 
-            # FEATURES
-            # get sentence and entity pos
-            sentence = ins['st_seg']
-            en1pos = ins['ent1_p2']
-            en2pos = ins['ent2_p2']
-            sen_len_w = len(sentence)
-            e1 = [w.decode('utf8') for w in sentence[en1pos].split('_con_')]
-            e2 = [w.decode('utf8') for w in sentence[en2pos].split('_con_')]
-
-            sentence_c, (en1pos_c, en2pos_c), sen_len_c, e1_c, e2_c = feature_word2char(sentence, en1pos, en2pos)
-            output, output_c = [], []
-
-            # get relative position
-            for i in range(fixlen_w):
-                word = word2id[u'_BLANK']
-                rel_e1 = pos_embed(i - en1pos, maxlen_w)
-                rel_e2 = pos_embed(i - en2pos, maxlen_w)
-                output.append([word, rel_e1, rel_e2])
-
-            # translate the words in sentences to index
-            for i in range(min(fixlen_w, len(sentence))):
-                if sentence[i].decode('utf8') not in word2id:
-                    word = word2id[u'_UNK']
-                else:
-                    word = word2id[sentence[i].decode('utf8')]
-                output[i][0] = word
-
-            # get relative position
-            for i in range(fixlen_c):
-                char = char2id[u'_BLANK']
-                rel_e1_c = pos_embed(i - en1pos_c, maxlen_c)
-                rel_e2_c = pos_embed(i - en2pos_c, maxlen_c)
-                output_c.append([char, rel_e1_c, rel_e2_c])
-
-            # translate the characters in sentences to index
-            for i in range(min(fixlen_c, len(sentence_c))):
-                if sentence_c[i] not in char2id:
-                    char = char2id[u'_UNK']
-                else:
-                    char = char2id[sentence_c[i]]
-                output_c[i][0] = char
-
-            # translate the entity representation to index
-            e1_idx = [word2id[w] if w in word2id else word2id[u'_UNK'] for w in e1]
-            e2_idx = [word2id[w] if w in word2id else word2id[u'_UNK'] for w in e2]
-            e1_idx_c = [char2id[c] if c in char2id else char2id[u'_UNK'] for c in e1_c]
-            e2_idx_c = [char2id[c] if c in char2id else char2id[u'_UNK'] for c in e2_c]
-
-            # by instance
-            output = np.asarray(output).T
-            sen_idx, sen_p1, sen_p2 = output[0], output[1], output[2]
-            sen_all.append(sen_idx)
-            sen_pos1_all.append(sen_p1)
-            sen_pos2_all.append(sen_p2)
-            sen_len_all.append(sen_len_w)
-            e1_all.append(e1_idx)
-            e2_all.append(e2_idx)
-            e1_len_all.append(len(e1_idx))
-            e2_len_all.append(len(e2_idx))
-
-            output_c = np.asarray(output_c).T
-            sen_idx, sen_p1, sen_p2 = output_c[0], output_c[1], output_c[2]
-            sen_all_c.append(sen_idx)
-            sen_pos1_all_c.append(sen_p1)
-            sen_pos2_all_c.append(sen_p2)
-            sen_len_all_c.append(sen_len_c)
-            e1_all_c.append(e1_idx_c)
-            e2_all_c.append(e2_idx_c)
-            e1_len_all_c.append(len(e1_idx_c))
-            e2_len_all_c.append(len(e2_idx_c))
-
             # by entity pair
             sen[tup][label_tag].append(all_index)
 
             # increase index by one
             all_index += 1
 
-        print 'rel_{}, entity pair number: {}, instance number: {}'.format(rel, ep_counter_r, ins_counter_r)
+        print 'rel_{}, entity pair number: {}, instance number: {}'.format(rel, ep_counter_r, len(entity_pairs))
     print 'entity pair number all: {}, instance number all: {}'.format(ep_counter_all, all_index)
-    data_train.close()
 
-    # pad entity
-    pad_e1_all = np.full([len(e1_all), max_ent_len_w], word2id[u'_BLANK'], dtype=np.int32)
-    for i in range(len(e1_all)):
-        pad_e1_all[i, :len(e1_all[i])] = e1_all[i]
-    pad_e2_all = np.full([len(e2_all), max_ent_len_w], word2id[u'_BLANK'], dtype=np.int32)
-    for i in range(len(e2_all)):
-        pad_e2_all[i, :len(e2_all[i])] = e2_all[i]
-    pad_e1_all_c = np.full([len(e1_all_c), max_ent_len_c], char2id[u'_BLANK'], dtype=np.int32)
-    for i in range(len(e1_all_c)):
-        pad_e1_all_c[i, :len(e1_all_c[i])] = e1_all_c[i]
-    pad_e2_all_c = np.full([len(e2_all_c), max_ent_len_c], char2id[u'_BLANK'], dtype=np.int32)
-    for i in range(len(e2_all_c)):
-        pad_e2_all_c[i, :len(e2_all_c[i])] = e2_all_c[i]
-
-    feature_ins = (sen_all, sen_len_all, sen_pos1_all, sen_pos2_all,
-                   pad_e1_all, pad_e2_all, e1_len_all, e2_len_all)
-    feature_ins_c = (sen_all_c, sen_len_all_c, sen_pos1_all_c, sen_pos2_all_c,
-                     pad_e1_all_c, pad_e2_all_c, e1_len_all_c, e2_len_all_c)
-    feature_ep = (sen, ans)
+    return sen, ans
+
+
+def get_data_features(data_file, word2id, char2id, rel2id, process_num=None, ent_lens=default_ent_lens):
+    """
+    restructure data from original data file, get useful features
+    relations are processed in parallel by process_num processes (default cpu number), then merged in order
+    entities are padded to ent_lens (by word, by character)
+    :return: restructured data
+    """
+    print datetime.now(), 'processing {}...'.format(data_file)
+    rels = get_relations(data_file)
+
+    pool = Pool(process_num, initializer=init_worker, initargs=(word2id, char2id, rel2id, ent_lens))
+    rel_features = pool.map(get_rel_features, [(data_file, rel) for rel in rels])
+    pool.close()
+    pool.join()
+
+    feature_ep = organize_entity_pairs(rels, [features[0] for features in rel_features], len(rel2id))
+
+    # single-instance label
+    label_all = np.concatenate([np.full(len(features[0]), rel, dtype=narrow_dtype(len(rel2id) - 1))
+                                for rel, features in zip(rels, rel_features)])
+
+    # merge the relations in order
+    feature_ins = tuple(np.concatenate([features[1][i] for features in rel_features]) for i in range(len(ins_files)))
+    feature_ins_c = tuple(np.concatenate([features[2][i] for features in rel_features])
+                          for i in range(len(ins_files_c)))
 
     return label_all, feature_ins, feature_ins_c, feature_ep
 
 
+def save_data_features(data_file, part, word2id, char2id, rel2id, process_num=None, chunk_size=10000,
+                       incremental=False, ent_lens=default_ent_lens):
+    """
+    streaming get_data_features, s-ins features are written to ./data/s-ins/{part}_*.npy instead of returned
+    workers spill features of chunk_size instances at a time to a temporary directory, the chunks are then copied
+    in order into preallocated memory mapped outputs, so peak memory is bounded by the chunks, not the corpus
+    the saved files are the same as saving the outputs of get_data_features
+    the fingerprint and entity pairs of each relation are recorded in ./data/s-ins/{part}_rel_record.pkl,
+    if incremental, relations with an unchanged fingerprint are copied from the existing s-ins files
+    :return: data organized by entity pair
+    """
+    print datetime.now(), 'processing {}...'.format(data_file)
+    rels = get_relations(data_file)
+
+    # {relation: (fingerprint, entity pairs)} of the existing files and the offset of each relation in them
+    record_file = './data/s-ins/{}_rel_record.pkl'.format(part)
+    record = {}
+    if incremental and os.path.exists(record_file):
+        with open(record_file, 'rb') as f:
+            record = cPickle.load(f)
+    old_offsets = {}
+    offset = 0
+    for rel in sorted(record):
+        old_offsets[rel] = offset
+        offset += len(record[rel][1])
+    # a record that does not describe the existing files is not trusted, every relation is processed again
+    if record and any(len(np.load('./data/s-ins/{}_{}.npy'.format(part, fn), mmap_mode='r')) != offset
+                      for fn in ('y',) + ins_files + ins_files_c):
+        print 'the relation record does not match the s-ins files, processing every relation'
+        record, old_offsets = {}, {}
+
+    tmp_dir = tempfile.mkdtemp(dir='./data')
+    pool = Pool(process_num, initializer=init_worker, initargs=(word2id, char2id, rel2id, ent_lens))
+    rel_chunks = pool.map(
+        save_rel_features,
+        [(data_file, rel, tmp_dir, chunk_size, record[rel][0] if rel in record else None) for rel in rels]
+    )
+    pool.close()
+    pool.join()
+
+    # unchanged relations keep their recorded entity pairs
+    reused = set(rel for rel, chunks in zip(rels, rel_chunks) if chunks[0] is None)
+    rel_entity_pairs = [record[rel][1] if rel in reused else chunks[0] for rel, chunks in zip(rels, rel_chunks)]
+    if incremental:
+        print 'unchanged relations: {}, processed relations: {}'.format(
+            sorted(reused), [rel for rel in rels if rel not in reused])
+
+    feature_ep = organize_entity_pairs(rels, rel_entity_pairs, len(rel2id))
+    ins_num = sum(len(entity_pairs) for entity_pairs in rel_entity_pairs)
+
+    # label of each instance
+    label_all = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, 'y.npy'), mode='w+', dtype=narrow_dtype(len(rel2id) - 1), shape=(ins_num,)
+    )
+    offset = 0
+    for rel, entity_pairs in zip(rels, rel_entity_pairs):
+        label_all[offset: offset + len(entity_pairs)] = rel
+        offset += len(entity_pairs)
+    del label_all
+
+    chunk_path = os.path.join(tmp_dir, '{}_{}_{}.npy')
+    chunk_files = [(rel, chunk) for rel, chunks in zip(rels, rel_chunks) for chunk in range(chunks[1])]
+    for fn in ins_files + ins_files_c:
+        old_feature = np.load('./data/s-ins/{}_{}.npy'.format(part, fn), mmap_mode='r') if reused else None
+        if chunk_files:
+            first = np.load(chunk_path.format(chunk_files[0][0], chunk_files[0][1], fn), mmap_mode='r')
+        else:
+            first = old_feature
+        feature = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, '{}.npy'.format(fn)), mode='w+', dtype=first.dtype,
+            shape=(ins_num,) + first.shape[1:]
+        )
+        del first
+        offset = 0
+        for rel, (_, chunk_num, _), entity_pairs in zip(rels, rel_chunks, rel_entity_pairs):
+            if rel in reused:
+                feature[offset: offset + len(entity_pairs)] = \
+                    old_feature[old_offsets[rel]: old_offsets[rel] + len(entity_pairs)]
+                offset += len(entity_pairs)
+                continue
+            for chunk in range(chunk_num):
+                array = np.load(chunk_path.format(rel, chunk, fn))
+                feature[offset: offset + len(array)] = array
+                offset += len(array)
+                os.remove(chunk_path.format(rel, chunk, fn))
+        feature.flush()
+        del feature, old_feature
+
+    # every file is written before any is replaced, the record is removed while they are replaced, so an
+    # interrupted run leaves no record and the next one processes every relation
+    if os.path.exists(record_file):
+        os.remove(record_file)
+    for fn in ('y',) + ins_files + ins_files_c:
+        os.rename(os.path.join(tmp_dir, '{}.npy'.format(fn)), './data/s-ins/{}_{}.npy'.format(part, fn))
+    os.rmdir(tmp_dir)
+
+    with open(record_file, 'wb') as f:
+        cPickle.dump(dict((rel, (chunks[2], entity_pairs))
+                          for rel, chunks, entity_pairs in zip(rels, rel_chunks, rel_entity_pairs)), f)
+
+    return feature_ep
+
+
 def organize_ep2np(data_ep, file_name):
     """
     transform data organized by entity pair to numpy form
@@ -386,85 +589,78 @@ def organize_ep2np(data_ep, file_name):
             lab_num = len(x_ep[i])
             for j in range(lab_num):
                 x_np.append(x_ep[i][j])
-                y_np.append(y_ep[i][j])
+                y_np.append(np.argmax(y_ep[i][j]))
                 f.write('{}\t{}\t{}\t{}\t{}\n'.format(temp, i[0], i[1], np.argmax(y_ep[i][j]), x_ep[i][j]))
                 temp += 1
 
     x_np = np.asarray(x_np)
+    # integer label of each bag
     y_np = np.asarray(y_np)
+    y_np = y_np.astype(narrow_dtype(int(y_np.max()) if len(y_np) else 0))
 
     return x_np, y_np
 
 
-def init():
+def init(chunk_size=0, process_num=None, incremental=False, ent_len_quantile=None):
     """
     process original data
+    :param chunk_size: if > 0, stream s-ins features to their files chunk_size instances at a time
+    :param process_num: number of preprocessing processes, default is cpu number
+    :param incremental: only process the relations changed since the last streaming run and keep the embeddings,
+                        the rest of the features are copied from the existing files
+    :param ent_len_quantile: if given, entities are padded to the length covering this quantile of the train and
+                             test entities instead of 80 words / 116 characters
     """
-    # get index of word, character and relation
-    word2id = get_word_emb()
-    char2id = get_char_emb()
-    rel2id = get_rel_idx()
-
-    # process train data
-    train_data_file = './origin_data/instances_rel_train.h5'
-
-    train_label_all, train_feature_ins, train_feature_ins_c, train_feature_ep = get_data_features(
-        train_data_file, word2id, char2id, rel2id
-    )
-
-    # process test data
-    test_data_file = './origin_data/instances_rel_test.h5'
-
-    test_label_all, test_feature_ins, test_feature_ins_c, test_feature_ep = get_data_features(
-        test_data_file, word2id, char2id, rel2id
-    )
+    data_files = ['./origin_data/instances_rel_{}.h5'.format(part) for part in ('train', 'test')]
+    if incremental:
+        # new embedding index would change every feature, reuse the existing one
+        word2id = Vocab('./data/word')
+        char2id = Vocab('./data/char')
+        rel2id = get_rel_idx()
+        chunk_size = chunk_size or 10000
+        # features of the older preprocessing store position matrices, the copied ones must have the new files
+        assert all(os.path.exists('./data/s-ins/{}_{}.npy'.format(part, fn))
+                   for part in ('train', 'test') for fn in ins_files + ins_files_c), \
+            'existing features are of an older format, run without --incremental'
+        # new features must have the width of the copied ones
+        ent_lens = tuple(np.load('./data/s-ins/train_{}.npy'.format(fn), mmap_mode='r').shape[1]
+                         for fn in ('e1', 'e1_c'))
+    else:
+        # get index of word, character and relation
+        word2id = get_word_emb()
+        char2id = get_char_emb()
+        rel2id = get_rel_idx()
+        if ent_len_quantile is not None:
+            ent_lens = get_ent_lens(data_files, ent_len_quantile, process_num)
+        else:
+            ent_lens = default_ent_lens
+    print 'entity pad length by word: {}, by character: {}'.format(*ent_lens)
+
+    # process train and test data, s-ins features are saved before the next part is processed
+    feature_ep = {}
+    for part, data_file in zip(('train', 'test'), data_files):
+        if chunk_size > 0:
+            feature_ep[part] = save_data_features(
+                data_file, part, word2id, char2id, rel2id, process_num=process_num, chunk_size=chunk_size,
+                incremental=incremental, ent_lens=ent_lens
+            )
+            continue
+
+        label_all, feature_ins, feature_ins_c, feature_ep[part] = get_data_features(
+            data_file, word2id, char2id, rel2id, process_num=process_num, ent_lens=ent_lens
+        )
+        print 'saving s-ins...'
+        np.save('./data/s-ins/{}_y.npy'.format(part), np.asarray(label_all))
+        for fn, feature in zip(ins_files + ins_files_c, feature_ins + feature_ins_c):
+            np.save('./data/s-ins/{}_{}.npy'.format(part, fn), np.asarray(feature))
+        del label_all, feature_ins, feature_ins_c
+        # features without a relation record can not be updated incrementally
+        if os.path.exists('./data/s-ins/{}_rel_record.pkl'.format(part)):
+            os.remove('./data/s-ins/{}_rel_record.pkl'.format(part))
 
     # multi-instance to numpy form
-    train_x, train_y = organize_ep2np(train_feature_ep, 'train_q&a')
-    test_x, test_y = organize_ep2np(test_feature_ep, 'test_q&a')
-
-    print 'saving s-ins...'
-    # train
-    np.save('./data/s-ins/train_y.npy', np.asarray(train_label_all))
-
-    np.save('./data/s-ins/train_word.npy', np.asarray(train_feature_ins[0]))
-    np.save('./data/s-ins/train_len.npy', np.asarray(train_feature_ins[1]))
-    np.save('./data/s-ins/train_pos1.npy', np.asarray(train_feature_ins[2]))
-    np.save('./data/s-ins/train_pos2.npy', np.asarray(train_feature_ins[3]))
-    np.save('./data/s-ins/train_e1.npy', np.asarray(train_feature_ins[4]))
-    np.save('./data/s-ins/train_e2.npy', np.asarray(train_feature_ins[5]))
-    np.save('./data/s-ins/train_e1_len.npy', np.asarray(train_feature_ins[6]))
-    np.save('./data/s-ins/train_e2_len.npy', np.asarray(train_feature_ins[7]))
-
-    np.save('./data/s-ins/train_char.npy', np.asarray(train_feature_ins_c[0]))
-    np.save('./data/s-ins/train_len_c.npy', np.asarray(train_feature_ins_c[1]))
-    np.save('./data/s-ins/train_pos1_c.npy', np.asarray(train_feature_ins_c[2]))
-    np.save('./data/s-ins/train_pos2_c.npy', np.asarray(train_feature_ins_c[3]))
-    np.save('./data/s-ins/train_e1_c.npy', np.asarray(train_feature_ins_c[4]))
-    np.save('./data/s-ins/train_e2_c.npy', np.asarray(train_feature_ins_c[5]))
-    np.save('./data/s-ins/train_e1_len_c.npy', np.asarray(train_feature_ins_c[6]))
-    np.save('./data/s-ins/train_e2_len_c.npy', np.asarray(train_feature_ins_c[7]))
-
-    # test
-    np.save('./data/s-ins/test_y.npy', np.asarray(test_label_all))
-
-    np.save('./data/s-ins/test_word.npy', np.asarray(test_feature_ins[0]))
-    np.save('./data/s-ins/test_len.npy', np.asarray(test_feature_ins[1]))
-    np.save('./data/s-ins/test_pos1.npy', np.asarray(test_feature_ins[2]))
-    np.save('./data/s-ins/test_pos2.npy', np.asarray(test_feature_ins[3]))
-    np.save('./data/s-ins/test_e1.npy', np.asarray(test_feature_ins[4]))
-    np.save('./data/s-ins/test_e2.npy', np.asarray(test_feature_ins[5]))
-    np.save('./data/s-ins/test_e1_len.npy', np.asarray(test_feature_ins[6]))
-    np.save('./data/s-ins/test_e2_len.npy', np.asarray(test_feature_ins[7]))
-
-    np.save('./data/s-ins/test_char.npy', np.asarray(test_feature_ins_c[0]))
-    np.save('./data/s-ins/test_len_c.npy', np.asarray(test_feature_ins_c[1]))
-    np.save('./data/s-ins/test_pos1_c.npy', np.asarray(test_feature_ins_c[2]))
-    np.save('./data/s-ins/test_pos2_c.npy', np.asarray(test_feature_ins_c[3]))
-    np.save('./data/s-ins/test_e1_c.npy', np.asarray(test_feature_ins_c[4]))
-    np.save('./data/s-ins/test_e2_c.npy', np.asarray(test_feature_ins_c[5]))
-    np.save('./data/s-ins/test_e1_len_c.npy', np.asarray(test_feature_ins_c[6]))
-    np.save('./data/s-ins/test_e2_len_c.npy', np.asarray(test_feature_ins_c[7]))
+    train_x, train_y = organize_ep2np(feature_ep['train'], 'train_q&a')
+    test_x, test_y = organize_ep2np(feature_ep['test'], 'test_q&a')
 
     print 'saving m-ins...'
     np.save('./data/m-ins/train_x.npy', train_x)
@@ -474,4 +670,18 @@ def init():
 
 
 if __name__ == '__main__':
-    init()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk_size', type=int, default=0,
+                        help='stream features to disk chunk_size instances at a time, 0 keeps them in memory')
+    parser.add_argument('--process_num', type=int, default=None, help='preprocessing processes, default cpu number')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process relations changed since the last streaming run, implies streaming')
+    parser.add_argument('--ent_len_quantile', type=float, default=None,
+                        help='pad entities to the length covering this quantile of the entities, e.g. 1.0 for the '
+                             'longest one, default pads to 80 words / 116 characters')
+    args = parser.parse_args()
+    if args.incremental and args.ent_len_quantile is not None:
+        parser.error('--incremental keeps the entity pad length of the existing features')
+    if args.ent_len_quantile is not None and not 0 < args.ent_len_quantile <= 1:
+        parser.error('--ent_len_quantile must be in (0, 1]')
+    init(args.chunk_size, args.process_num, args.incremental, args.ent_len_quantile)
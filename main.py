@@ -4,8 +4,13 @@
 import os
 import argparse
 import time
+import random
 import cPickle
-from data_loader import DataLoader
+import threading
+import traceback
+import Queue
+from data_loader import DataLoader, DatasetInput, model_inputs
+from vocab import Vocab
 from model_settings import *
 from models import *
 from evaluate import *
@@ -49,43 +54,151 @@ def get_ids(c_feature):
     """
     get index of word, character and relation
     :param c_feature: if c_feature is true, use character level features
-    :return:
+    :return: vocabulary of token to index, array of index to token, dict of index to relation
     """
-    if c_feature:
-        with open('./data/id2char.pkl', 'rb') as f:
-            id2x = cPickle.load(f)
-        with open('./data/char2id.pkl', 'rb') as f:
-            x2id = cPickle.load(f)
-    else:
-        with open('./data/id2word.pkl', 'rb') as f:
-            id2x = cPickle.load(f)
-        with open('./data/word2id.pkl', 'rb') as f:
-            x2id = cPickle.load(f)
+    x2id = Vocab('./data/char' if c_feature else './data/word')
+    id2x = x2id.tokens
     with open('./origin_data/idx2rel.pkl', 'rb') as f:
         id2rel = cPickle.load(f)
 
     return x2id, id2x, id2rel
 
 
-def train_evaluate(data_loader, model, model_setting, epoch_num, batch_size):
+def get_model_path(model_name, c_feature):
+    """
+    directory of the results of a model, one time_id sub directory per run
+    """
+    return os.path.join('./result', model_name, 'c_level' if c_feature else 'w_level')
+
+
+def latest_result(model_path):
+    """
+    the latest run under model_path with a training state to resume from, None if there is none
+    """
+    if not os.path.exists(model_path):
+        return None
+    res_paths = [os.path.join(model_path, time_id) for time_id in sorted(os.listdir(model_path))]
+    res_paths = [res_path for res_path in res_paths if os.path.exists(os.path.join(res_path, 'train_state.pkl'))]
+    return res_paths[-1] if res_paths else None
+
+
+def save_train_state(session, saver, res_path, state):
+    """
+    checkpoint the variables, optimizer slots included, then the counters, early stop and shuffle state
+    the state file is replaced atomically and always names a complete checkpoint
+    """
+    state['checkpoint'] = saver.save(
+        session, os.path.join(res_path, 'checkpoint', 'train_ckpt'), global_step=state['iter_num_tot']
+    )
+    state_file = os.path.join(res_path, 'train_state.pkl')
+    with open(state_file + '.tmp', 'wb') as f:
+        cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(state_file + '.tmp', state_file)
+
+
+class LogWriter(object):
+    """
+    run logging jobs (log file writes, prints, summaries) in a background thread, in the order they are submitted
+    the training thread only puts the job and its arguments in a queue
+    """
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, job, *args):
+        self.queue.put((job, args))
+
+    def write(self, log_file, text):
+        self.submit(log_file.write, text)
+
+    def show(self, text):
+        self.submit(show, text)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            job, args = item
+            # a failed job is reported and the later ones still run
+            try:
+                job(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        """
+        finish the submitted jobs and stop the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+
+def show(text):
+    print text
+
+
+def log_train_step(log_prf, step_time, epoch_num, iter_num, loss, c_label, c_ans, rel_num):
+    """
+    train p, r, f1 of one batch to log_prf and the console, run by the LogWriter
+    the macro average is over all rel_num relations, as for the test metrics
+    """
+    _, prf_macro, _ = get_p_r_f1(c_label, c_ans, rel_num=rel_num)
+    p, r, f1 = prf_macro
+    log_info = 'train: ' + time.strftime('%y_%m_%d %H:%M:%S', time.localtime(step_time)) + \
+               ' epoch: {:>3}, batch: {:>4}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
+                   epoch_num, iter_num, loss, p * 100, r * 100, f1 * 100)
+    log_prf.write(log_info)
+    print log_info.rstrip('\n')
+
+
+def train_evaluate(data_loader, model, model_setting, epoch_num, batch_size, dataset_input=None, res_path=None,
+                   checkpoint_steps=0, test_batch_size=None, log_steps=50):
     """
     train and evaluate model
+    if dataset_input is given, the model reads training batches from its tf.data iterator
+    train p, r, f1 and summaries are computed every log_steps batches only and written by a LogWriter
+    evaluation runs every test instance in batches of test_batch_size, default is batch_size
+    a training state is checkpointed after every epoch and every checkpoint_steps batches (0 only after epochs),
+    if res_path is given, training resumes from its latest checkpoint
     """
     # get indexes
     x2id, id2x, id2rel = get_ids(data_loader.c_feature)
 
     # result saving path
-    model_path = os.path.join('./result', model.model_name, 'c_level' if data_loader.c_feature else 'w_level')
-    time_id = time.strftime('%y%m%d_%H%M', time.localtime(time.time()))
-    res_path = os.path.join(model_path, time_id)
-    if not os.path.exists(res_path):
-        os.makedirs(res_path)
+    model_path = get_model_path(model.model_name, data_loader.c_feature)
+    resume = res_path is not None
+    if not resume:
+        time_id = time.strftime('%y%m%d_%H%M', time.localtime(time.time()))
+        res_path = os.path.join(model_path, time_id)
+    time_id = os.path.basename(res_path)
+    if not os.path.exists(os.path.join(res_path, 'checkpoint')):
+        os.makedirs(os.path.join(res_path, 'checkpoint'))
 
     # log files
     log_setting = tf.gfile.GFile(os.path.join(res_path, 'setting.txt'), mode='a')
     log_prf = tf.gfile.GFile(os.path.join(res_path, 'prf.txt'), mode='a')
     log_ana = tf.gfile.GFile(os.path.join(res_path, 'analysis.txt'), mode='a')
 
+    # training state, rng_state is the shuffle state at the start of epoch, iter_num batches of it are done
+    state = {'epoch': 0, 'iter_num': 0, 'iter_num_tot': 0, 'best_test_f1': 0, 'el_counter': 0,
+             'rng_state': None}
+    if resume:
+        with open(os.path.join(res_path, 'train_state.pkl'), 'rb') as f:
+            state = cPickle.load(f)
+        resume_info = 'resume from epoch: {}, batch: {}, {}'.format(state['epoch'], state['iter_num'],
+                                                                    state['checkpoint'])
+        print resume_info
+        log_setting.write(resume_info + '\n')
+        log_prf.write(resume_info + '\n')
+        if state['el_counter'] == 5:
+            print 'training of {} has stopped early'.format(res_path)
+            return
+        random.setstate(state['rng_state'][0])
+        np.random.set_state(state['rng_state'][1])
+
     log_setting.write(model.model_name + '\n')
     log_setting.write('=' * 80 + '\n')
     for para in sorted(model_setting.__dict__.keys()):
@@ -94,7 +207,11 @@ def train_evaluate(data_loader, model, model_setting, epoch_num, batch_size):
         log_setting.write(pv_str + '\n')
     log_setting.write('=' * 80 + '\n')
     log_setting.write('batch_size: {}\n'.format(batch_size))
+    log_setting.write('test_batch_size: {}\n'.format(test_batch_size or batch_size))
     log_setting.write('epoch num: {}\n'.format(epoch_num))
+    # model setting for restoring the model, see infer.py
+    with open(os.path.join(res_path, 'model_setting.pkl'), 'wb') as f:
+        cPickle.dump(model_setting, f)
 
     # tensor board
     tb_path = os.path.join(model_path, 'TensorBoard', time_id)
@@ -102,118 +219,162 @@ def train_evaluate(data_loader, model, model_setting, epoch_num, batch_size):
         os.makedirs(tb_path)
     tb_writer = tf.summary.FileWriter(tb_path)
 
-    with tf.Session() as session:
-        # initialize variables
-        tf.global_variables_initializer().run()
-        # model saver
-        saver = tf.train.Saver(max_to_keep=None)
-        # tensor board
-        tb_writer.add_graph(session.graph)
-        # best evaluation f1
-        best_test_f1 = 0
-        # total iter number
-        iter_num_tot = 0
-        # early stop
-        el_counter = 0
-        for epoch_num in range(epoch_num):
-            # train
-            iter_num = 0
-            batches = data_loader.get_train_batches(batch_size=batch_size)
-            for batch in batches:
-                model_summary, loss = model.fit(session, batch, dropout_keep_rate=model_setting.dropout_rate)
-                _, c_label, _ = model.evaluate(session, batch)
-                if iter_num_tot % 50 == 0:
-                    tb_writer.add_summary(model_summary, iter_num_tot)
-                if iter_num % 50 == 0:
-                    _, prf_macro, _ = get_p_r_f1(c_label, batch.y)
-                    p, r, f1 = prf_macro
-                    log_info = 'train: ' + time.strftime('%y_%m_%d %H:%M:%S', time.localtime(time.time())) + \
-                               ' epoch: {:>3}, batch: {:>4}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
-                                   epoch_num, iter_num, loss, p * 100, r * 100, f1 * 100)
-                    log_prf.write(log_info)
-                    print 'train: ', time.strftime('%y_%m_%d %H:%M:%S', time.localtime(time.time())), \
-                        ' epoch: {:>3}, batch: {:>4}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%'.format(
-                            epoch_num, iter_num, loss, p * 100, r * 100, f1 * 100)
-                iter_num_tot += 1
-                iter_num += 1
-
-            # test
-            use_neg = True
-            test_batches = data_loader.get_test_batches(batch_size)
-            test_loss, test_prob, test_pred, test_ans = [], [], [], []
-            test_x, test_p1, test_p2 = [], [], []
-            for batch in test_batches:
-                batch_loss, batch_pred, batch_prob = model.evaluate(session, batch)
-                test_loss.append(batch_loss)
-                test_prob += list(batch_prob)
-                test_pred += list(batch_pred)
-                test_ans += list(batch.y)
-                if not data_loader.multi_ins:
-                    test_x += list(batch.x)
-                    test_p1 += list(batch.pos1[:, 0])
-                    test_p2 += list(batch.pos2[:, 0])
-            test_loss = np.mean(test_loss)
-            prf_list, prf_macro, prf_micro = get_p_r_f1(test_pred, test_ans, use_neg)
-            p, r, f1 = prf_macro
-            log_info = 'test : ' + time.strftime('%y_%m_%d %H:%M:%S', time.localtime(time.time())) + \
-                       ' epoch: {:>3}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
-                           epoch_num, test_loss, p * 100, r * 100, f1 * 100)
-
-            # best performance
-            if f1 > best_test_f1:
-                el_counter = 0
-                best_test_f1 = f1
-                # record p, r, f1
-                log_ana.write(log_info)
-                if use_neg:
-                    for idx in range(len(prf_list)):
-                        rel_prf = 'rel: {:>2}_{:<6}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
-                            idx, id2rel[idx], prf_list[idx][3] * 100, prf_list[idx][4] * 100, prf_list[idx][5] * 100
-                        )
-                        log_ana.write(rel_prf)
+    log_writer = LogWriter()
+    # the queued logs and summaries are written even if training is interrupted
+    try:
+        with tf.Session() as session:
+            # initialize variables, the embedding values are fed rather than stored in the graph
+            session.run(tf.global_variables_initializer(), feed_dict=model.init_feed_dict)
+            if dataset_input is not None:
+                dataset_input.initialize(session)
+            # model saver
+            saver = tf.train.Saver(max_to_keep=None)
+            # training checkpoint saver, the previous checkpoint is kept until the state names the new one
+            ckpt_saver = tf.train.Saver(max_to_keep=2)
+            if resume:
+                ckpt_saver.restore(session, state['checkpoint'])
+            else:
+                # tensor board
+                tb_writer.add_graph(session.graph)
+            # best evaluation f1
+            best_test_f1 = state['best_test_f1']
+            # total iter number
+            iter_num_tot = state['iter_num_tot']
+            # early stop
+            el_counter = state['el_counter']
+            for epoch_num in range(state['epoch'], epoch_num):
+                # shuffle state at the start of the epoch, a resumed epoch replays the same batch order
+                epoch_rng_state = (random.getstate(), np.random.get_state())
+                # train
+                iter_num = state['iter_num'] if epoch_num == state['epoch'] else 0
+                if dataset_input is not None:
+                    batches = dataset_input.get_train_batches(skip=iter_num)
                 else:
-                    for idx in range(len(prf_list)):
-                        rel_prf = 'rel: {}_{}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
-                            idx+1, id2rel[idx+1],
-                            prf_list[idx][3] * 100, prf_list[idx][4] * 100, prf_list[idx][5] * 100
+                    batches = data_loader.get_train_batches(batch_size=batch_size, skip=iter_num)
+                for batch in batches:
+                    # train op, loss, labels and summary are fetched by one session.run, labels and summary
+                    # only on the logged steps
+                    log_step = iter_num % log_steps == 0
+                    model_summary, loss, c_label, c_ans = model.fit(
+                        session, batch, dropout_keep_rate=model_setting.dropout_rate,
+                        with_summary=iter_num_tot % log_steps == 0, with_labels=log_step
+                    )
+                    if model_summary is not None:
+                        log_writer.submit(tb_writer.add_summary, model_summary, iter_num_tot)
+                    if log_step:
+                        log_writer.submit(log_train_step, log_prf, time.time(), epoch_num, iter_num, loss, c_label,
+                                          c_ans, model_setting.class_num)
+                    iter_num_tot += 1
+                    iter_num += 1
+                    if checkpoint_steps and iter_num_tot % checkpoint_steps == 0:
+                        save_train_state(session, ckpt_saver, res_path, {
+                            'epoch': epoch_num, 'iter_num': iter_num, 'iter_num_tot': iter_num_tot,
+                            'best_test_f1': best_test_f1, 'el_counter': el_counter, 'rng_state': epoch_rng_state
+                        })
+
+                # test
+                use_neg = True
+                test_batches = data_loader.get_test_batches(test_batch_size or batch_size)
+                metrics = MetricsAccumulator(model_setting.class_num, use_neg)
+                # probabilities and answers are written as they come, the files are kept for the best epoch only
+                test_num = data_loader.test_size()
+                prob_file = os.path.join(res_path, 'test_prob.npy.tmp')
+                ans_file = os.path.join(res_path, 'test_ans.npy.tmp')
+                test_prob = np.lib.format.open_memmap(
+                    prob_file, mode='w+', dtype=np.float32, shape=(test_num, model_setting.class_num)
+                )
+                test_ans = np.lib.format.open_memmap(ans_file, mode='w+', dtype=np.int32, shape=(test_num,))
+                test_loss, offset = [], 0
+                # only wrong labeled instances are kept for the analysis
+                wrong_pred, wrong_ans, wrong_x, wrong_e1p, wrong_e2p = [], [], [], [], []
+                for batch in test_batches:
+                    batch_loss, batch_pred, batch_prob = model.evaluate(session, batch)
+                    batch_ans = batch.y
+                    test_loss.append(batch_loss)
+                    metrics.update(batch_pred, batch_ans)
+                    test_prob[offset: offset + len(batch_pred)] = batch_prob
+                    test_ans[offset: offset + len(batch_pred)] = batch_ans
+                    offset += len(batch_pred)
+                    if not data_loader.multi_ins:
+                        wrong = batch_pred != batch_ans
+                        wrong_pred.append(batch_pred[wrong])
+                        wrong_ans.append(batch_ans[wrong])
+                        wrong_x.append(batch.x[wrong])
+                        wrong_e1p.append(batch.epos[wrong, 0])
+                        wrong_e2p.append(batch.epos[wrong, 1])
+                test_prob.flush()
+                test_ans.flush()
+                del test_prob, test_ans
+                test_loss = np.mean(test_loss)
+                prf_list, prf_macro, prf_micro = metrics.result()
+                p, r, f1 = prf_macro
+                log_info = 'test : ' + time.strftime('%y_%m_%d %H:%M:%S', time.localtime(time.time())) + \
+                           ' epoch: {:>3}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
+                               epoch_num, test_loss, p * 100, r * 100, f1 * 100)
+
+                # best performance
+                if f1 > best_test_f1:
+                    el_counter = 0
+                    best_test_f1 = f1
+                    # record p, r, f1
+                    log_ana.write(log_info)
+                    if use_neg:
+                        for idx in range(len(prf_list)):
+                            rel_prf = 'rel: {:>2}_{:<6}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
+                                idx, id2rel[idx], prf_list[idx][3] * 100, prf_list[idx][4] * 100, prf_list[idx][5] * 100
+                            )
+                            log_ana.write(rel_prf)
+                    else:
+                        for idx in range(len(prf_list)):
+                            rel_prf = 'rel: {}_{}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%\n'.format(
+                                idx+1, id2rel[idx+1],
+                                prf_list[idx][3] * 100, prf_list[idx][4] * 100, prf_list[idx][5] * 100
+                            )
+                            log_ana.write(rel_prf)
+
+                    # record wrong instance multi-instance do no support this process
+                    if not data_loader.multi_ins and sum(len(pred) for pred in wrong_pred):
+                        wrong_ins = get_wrong_ins(
+                            np.concatenate(wrong_pred), np.concatenate(wrong_ans), np.concatenate(wrong_x),
+                            np.concatenate(wrong_e1p), np.concatenate(wrong_e2p), x2id, id2x, id2rel, use_neg
                         )
-                        log_ana.write(rel_prf)
+                        wrong_ins = sorted(wrong_ins, key=lambda x: x[1])
+                        wrong_ins = ['\t'.join(i) + '\n' for i in wrong_ins]
+                        for ins in wrong_ins:
+                            log_ana.write(ins)
+                    log_ana.write('-' * 80 + '\n')
+
+                    # save pr data
+                    os.rename(prob_file, os.path.join(res_path, 'test_prob_{}.npy'.format(epoch_num)))
+                    os.rename(ans_file, os.path.join(res_path, 'test_ans_{}.npy'.format(epoch_num)))
+
+                    # draw pr curve
+                    # prc_fn = os.path.join(res_path, 'prc_epoch{}.png'.format(epoch_num))
+                    # save_prcurve(test_prob, test_ans, model.model_name, prc_fn)
+
+                    # save model
+                    saver.save(session, os.path.join(res_path, 'model_saved'))
+                else:
+                    el_counter += 1
+                    os.remove(prob_file)
+                    os.remove(ans_file)
 
-                # record wrong instance multi-instance do no support this process
-                if not data_loader.multi_ins:
-                    wrong_ins = get_wrong_ins(
-                        test_pred, test_ans, test_x, test_p1, test_p2, x2id, id2x, id2rel, use_neg
-                    )
-                    wrong_ins = sorted(wrong_ins, key=lambda x: x[1])
-                    wrong_ins = ['\t'.join(i) + '\n' for i in wrong_ins]
-                    for ins in wrong_ins:
-                        log_ana.write(ins)
-                log_ana.write('-' * 80 + '\n')
-
-                # save pr data
-                test_prob = np.asarray(test_prob)
-                test_ans = np.asarray(test_ans)
-                np.save(os.path.join(res_path, 'test_prob_{}.npy'.format(epoch_num)), test_prob)
-                np.save(os.path.join(res_path, 'test_ans_{}.npy'.format(epoch_num)), test_ans)
-
-                # draw pr curve
-                # prc_fn = os.path.join(res_path, 'prc_epoch{}.png'.format(epoch_num))
-                # save_prcurve(test_prob, test_ans, model.model_name, prc_fn)
-
-                # save model
-                saver.save(session, os.path.join(res_path, 'model_saved'))
-            else:
-                el_counter += 1
+                log_writer.write(log_prf, log_info)
+                log_writer.write(log_prf, '-' * 80 + '\n')
+                log_writer.show(log_info.rstrip('\n'))
 
-            log_prf.write(log_info)
-            log_prf.write('-' * 80 + '\n')
-            print 'test : ', time.strftime('%y_%m_%d %H:%M:%S', time.localtime(time.time())), \
-                ' epoch: {:>3}, lost: {:.3f}, p: {:.3f}%, r: {:.3f}%, f1:{:.3f}%'.format(
-                    epoch_num, test_loss, p * 100, r * 100, f1 * 100)
+                # the next run starts from the next epoch
+                save_train_state(session, ckpt_saver, res_path, {
+                    'epoch': epoch_num + 1, 'iter_num': 0, 'iter_num_tot': iter_num_tot, 'best_test_f1': best_test_f1,
+                    'el_counter': el_counter, 'rng_state': (random.getstate(), np.random.get_state())
+                })
 
-            # stop training
-            if el_counter == 5:
-                break
+                # stop training
+                if el_counter == 5:
+                    break
+    finally:
+        log_writer.close()
+        tb_writer.close()
 
 
 def main():
@@ -232,40 +393,105 @@ def main():
     parser.set_defaults(c_feature=True, help='use character feature as default')
     parser.add_argument('--epoch_num', type=int, default=100, help='epoch number')
     parser.add_argument('--batch_size', type=int, default=512, help='batch size')
+    parser.add_argument('--log_steps', type=int, default=50,
+                        help='compute train p, r, f1 and summaries every log_steps batches')
+    parser.add_argument('--test_batch_size', type=int, default=2048,
+                        help='evaluation batch size, can be larger than batch_size as no gradients are kept')
+    parser.add_argument('--tf_data', action='store_true',
+                        help='feed training batches by a prefetching tf.data pipeline instead of feed_dict')
+    parser.add_argument('--mmap', action='store_true', help='memory map the feature arrays instead of reading them')
+    parser.add_argument('--bucket_width', type=int, default=0,
+                        help='batch sentences of similar length and trim the padding, in steps of bucket_width, '
+                             '0 disables bucketing')
+    parser.add_argument('--trim_ent', action='store_true',
+                        help='cut the entity padding of every batch to its longest entity, for entity models')
+    parser.add_argument('--resume', type=str, nargs='?', const='latest', default=None,
+                        help='continue training from the checkpoint of a result directory, '
+                             'the latest run of the model if no directory is given')
+    parser.add_argument('--checkpoint_steps', type=int, default=0,
+                        help='also checkpoint the training state every checkpoint_steps batches, '
+                             '0 only checkpoints after each epoch')
     args = parser.parse_args()
 
     # for model_name in ['birnn_deep', 'birnn_mi', 'birnn_res', 'birnn_selfatt']:
     #     model_setting = ms_dict[model_name]()
     #     data_loader = DataLoader('./data', c_feature=True, s_model=args.model_name)
 
-    # model setting
-    model_setting = ms_dict[args.model_name]()
+    # model setting, a resumed run keeps the setting it was started with
+    res_path = None
+    if args.resume is not None:
+        res_path = args.resume
+        if res_path == 'latest':
+            res_path = latest_result(get_model_path(m_dict[args.model_name].__name__, args.c_feature))
+        if res_path is None or not os.path.exists(os.path.join(res_path, 'train_state.pkl')):
+            parser.error('no training state to resume from')
+        # model and feature level come from the result directory result/<model>/<level>/<time_id>
+        level_dir = os.path.dirname(os.path.normpath(res_path))
+        class_name = os.path.basename(os.path.dirname(level_dir))
+        if class_name != m_dict[args.model_name].__name__ or \
+                os.path.basename(level_dir) != ('c_level' if args.c_feature else 'w_level'):
+            parser.error('{} is a {} {} run, not {} {}'.format(
+                res_path, class_name, os.path.basename(level_dir), args.model_name,
+                '--c_feature' if args.c_feature else '--w_feature'))
+        with open(os.path.join(res_path, 'model_setting.pkl'), 'rb') as f:
+            model_setting = cPickle.load(f)
+    else:
+        model_setting = ms_dict[args.model_name]()
 
     # initialize data loader
     multi_ins = True if '_mi' in args.model_name else False
+    if args.bucket_width and (multi_ins or args.tf_data):
+        parser.error('--bucket_width does not support multi-instance models or --tf_data')
+    if args.tf_data and args.mmap:
+        parser.error('--tf_data copies the training arrays into the graph, it can not be used with --mmap')
+    # trimmed batches must stay as long as the widest convolution filter
+    if args.bucket_width and args.bucket_width < max(getattr(model_setting, 'filter_sizes', [0])):
+        parser.error('--bucket_width must be at least the largest filter size {} of {}'.format(
+            max(model_setting.filter_sizes), args.model_name))
+    if args.trim_ent and (args.tf_data or 'e1_len' not in model_inputs[args.model_name]):
+        parser.error('--trim_ent needs an entity model with entity lengths and does not support --tf_data')
     print 'data loader initializing...'
-    data_loader = DataLoader('./data', c_feature=args.c_feature, multi_ins=multi_ins)
+    data_loader = DataLoader('./data', c_feature=args.c_feature, multi_ins=multi_ins, model_name=args.model_name,
+                             mmap_mode='r' if args.mmap else None, bucket_width=args.bucket_width,
+                             trim_ent=args.trim_ent)
 
     # update model setting
     model_setting.sen_len = data_loader.max_sen_len
     model_setting.ent_len = data_loader.max_ent_len
-
-    if multi_ins:
-        model_setting.bag_num = args.batch_size
+    model_setting.pos_max_len = data_loader.pos_max_len
 
     # each graph contains a model and the model's training and testing process
     # tf.Graph().as_default() is unnecessary if only train one model in one time, but is needed if you want
     # to train more than one models one time
+    if args.tf_data and multi_ins:
+        parser.error('--tf_data does not support multi-instance models')
+
     with tf.Graph().as_default():
+        # training input pipeline
+        dataset_input = None
+        if args.tf_data:
+            dataset_input = DatasetInput(data_loader, model_inputs[args.model_name], args.batch_size)
+
         # initialize model
         print 'initializing {} model...'.format(args.model_name)
-        model = m_dict[args.model_name](data_loader.embedding, model_setting)
+        model_kwargs = {}
+        if dataset_input is not None:
+            model_kwargs['inputs'] = dataset_input.tensors
+        if data_loader.ent_embedding is not None:
+            model_kwargs['ent_embedding'] = data_loader.ent_embedding
+        model = m_dict[args.model_name](data_loader.embedding, model_setting, **model_kwargs)
+        if args.bucket_width and not model.var_len:
+            parser.error('{} model takes fixed length inputs, bucketing is not supported'.format(model.model_name))
+        if args.trim_ent and not model.var_len:
+            parser.error('{} model takes fixed length entities, --trim_ent is not supported'.format(model.model_name))
         # print 'initializing {} model...'.format(model_name)
         # model = m_dict[model_name](data_loader.embedding, model_setting)
 
         # train and evaluate
         print 'training and evaluating model...'
-        train_evaluate(data_loader, model, model_setting, args.epoch_num, args.batch_size)
+        train_evaluate(data_loader, model, model_setting, args.epoch_num, args.batch_size, dataset_input,
+                       res_path=res_path, checkpoint_steps=args.checkpoint_steps, test_batch_size=args.test_batch_size,
+                       log_steps=args.log_steps)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,11 @@
 # -*- encoding: utf-8 -*-
 # Created by han on 17-8-15
 
+# embedding options of every setting:
+# embed_trainable: train the embedding tables, false keeps the pre-trained ones fixed
+# embed_l2: the l2 loss of the models that have one also covers the embedding tables
+# lazy_adam: update the embedding tables by lazy adam, only the rows looked up in the batch change
+
 
 class CnnSetting(object):
     def __init__(self):
@@ -9,11 +14,15 @@ class CnnSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # cnn
         self.filter_sizes = [3]
         self.filter_num = 200
         # learning settings
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -26,6 +35,7 @@ class CnnDeepSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # conv layers
         self.filter_sizes = [3, 5, 7, 7]
         self.filter_num = [256] * len(self.filter_sizes)
@@ -39,6 +49,9 @@ class CnnDeepSetting(object):
         assert len(self.dropout_mask) == len(self.filter_sizes) + len(self.fc_sizes)
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         # learning settings
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
@@ -51,13 +64,19 @@ class RnnSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size = 200
         self.layers = 1
         self.hidden_select = 'avg'
+        # 'dynamic' rnn stops at the length of each instance, 'static' rnn unrolls all padded steps
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -69,6 +88,7 @@ class RnnSelfAttSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size = 200
@@ -76,8 +96,12 @@ class RnnSelfAttSetting(object):
         # self attention hyper parameters
         self.da = 400
         self.r = 31
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -89,12 +113,16 @@ class RnnResSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size = 200
         self.layers = 2
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -106,12 +134,16 @@ class RnnDeepSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cells = ['gru', 'gru', 'gru']
         self.hidden_sizes = [200, 200, 200]
         assert len(self.cells) == len(self.hidden_sizes)
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -123,14 +155,19 @@ class RnnEntSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size_sen = 200
         self.hidden_size_ent = 200
         self.layers = 1
         self.hidden_select = 'avg'
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -142,13 +179,18 @@ class RnnAttEntSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size_sen = 200
         self.hidden_size_ent = 200
         self.layers = 1
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -160,6 +202,7 @@ class RnnCnnEntSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size_sen = 100
@@ -169,8 +212,12 @@ class RnnCnnEntSetting(object):
         # cnn
         self.filter_sizes = [3]
         self.filter_num = 200
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -182,6 +229,7 @@ class RnnResEntSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size_sen = 200
@@ -190,6 +238,9 @@ class RnnResEntSetting(object):
         self.hidden_select = 'avg'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
 
@@ -201,14 +252,17 @@ class RnnMiSetting(object):
         self.class_num = 31
         self.sen_len = 100
         self.ent_len = None
+        self.pos_max_len = None
         # rnn
         self.cell = 'gru'
         self.hidden_size = 200
         self.layers = 1
         self.hidden_select = 'avg'
+        self.rnn_mode = 'dynamic'
         # optimizer
         self.optimizer = 'adam'
+        self.embed_trainable = True
+        self.embed_l2 = True
+        self.lazy_adam = False
         self.learning_rate = 0.001
         self.dropout_rate = 0.5
-        # multi-instance
-        self.bag_num = None
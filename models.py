@@ -1,6 +1,5 @@
 # -*- encoding: utf-8 -*-
 # Created by han on 17-7-11
-import numpy as np
 import tensorflow as tf
 
 rnn_cell = {
@@ -16,17 +15,212 @@ opt_method = {
     'adagrad': tf.train.AdagradOptimizer
 }
 
+# graph collection of the embedding tables made by embedding_variable
+embed_collection = 'embedding_tables'
 
-class Cnn(object):
+
+def input_placeholder(inputs, key, dtype, shape, name):
+    """
+    model input, a plain placeholder, or a placeholder defaulting to the tf.data iterator tensor inputs[key]
+    feeding the placeholder (e.g. in evaluation) still overrides the iterator
+    """
+    if inputs is not None and key in inputs:
+        return tf.placeholder_with_default(tf.cast(inputs[key], dtype), shape, name=name)
+    return tf.placeholder(dtype, shape, name=name)
+
+
+def entity_inputs(input_e1, input_e2, input_e1_len=None, input_e2_len=None):
+    """
+    distinct entities of a batch, input_ent [U, L] with input_ent_len, and the row of e1 and e2 of each instance in
+    input_ent, input_e1_idx / input_e2_idx [batch]; by default the rows are e1 then e2 of every instance
+    feeding them leaves input_e1 / input_e2 unused, each distinct entity is encoded once
+    """
+    batch_size = tf.shape(input_e1)[0]
+    input_ent = tf.placeholder_with_default(
+        tf.concat([input_e1, input_e2], 0), input_e1.get_shape(), name='input_ent'
+    )
+    input_ent_len = None
+    if input_e1_len is not None:
+        input_ent_len = tf.placeholder_with_default(
+            tf.concat([input_e1_len, input_e2_len], 0), [None], name='input_ent_len'
+        )
+    input_e1_idx = tf.placeholder_with_default(tf.range(batch_size), [None], name='input_e1_idx')
+    input_e2_idx = tf.placeholder_with_default(tf.range(batch_size) + batch_size, [None], name='input_e2_idx')
+    return input_ent, input_ent_len, input_e1_idx, input_e2_idx
+
+
+def embedding_variable(name, embedding, init_feed_dict, trainable=True):
+    """
+    variable initialised from a placeholder, the values stay out of the graph however large the vocabulary is
+    the placeholder and embedding are added to init_feed_dict, which must be fed when the initializer runs
+    """
+    init_value = tf.placeholder(tf.float32, embedding.shape, name='{}_init'.format(name))
+    init_feed_dict[init_value] = embedding
+    table = tf.get_variable(name, initializer=init_value, trainable=trainable)
+    tf.add_to_collection(embed_collection, table)
+    return table
+
+
+def l2_weights(embed_l2=True):
+    """
+    trainable variables the l2 loss covers, without embed_l2 the embedding tables are left out so their gradients
+    stay sparse
+    """
+    tables = set(tf.get_collection(embed_collection))
+    return [var for var in tf.trainable_variables() if embed_l2 or var not in tables]
+
+
+def minimize(loss, setting):
+    """
+    training op of loss by setting.optimizer, with setting.lazy_adam the embedding tables are updated by lazy adam,
+    which only touches the rows looked up in the batch instead of the moments of the whole vocabulary
+    """
+    optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate)
+    tables = set(tf.get_collection(embed_collection)) & set(tf.trainable_variables())
+    if not (setting.lazy_adam and tables):
+        return optimizer.minimize(loss)
+    grads_and_vars = [(grad, var) for grad, var in optimizer.compute_gradients(loss) if grad is not None]
+    table_grads = [(grad, var) for grad, var in grads_and_vars if var in tables]
+    other_grads = [(grad, var) for grad, var in grads_and_vars if var not in tables]
+    lazy_optimizer = tf.contrib.opt.LazyAdamOptimizer(learning_rate=setting.learning_rate)
+    return tf.group(optimizer.apply_gradients(other_grads), lazy_optimizer.apply_gradients(table_grads))
+
+
+def model_tensors(model):
+    """
+    loss, class label and class probability tensors of a model, the ones fit and evaluate fetch
+    """
+    if hasattr(model, 'total_loss'):
+        # multi-instance model
+        return model.total_loss, model.predictions, model.prob
+    prob = model.softmax_res if hasattr(model, 'softmax_res') else model.softmax_output
+    return model.model_loss, model.class_label, prob
+
+
+class Model(object):
+    """
+    training and evaluation steps shared by the models, each model builds its graph and defines get_feed_dict
+    """
+    def fit(self, session, input_data, dropout_keep_rate, with_summary=False, with_labels=True):
+        """
+        one training step, loss, class label and answer (only if with_labels) and summary (only if with_summary)
+        come from a single run, steps that are not logged fetch the loss only
+        """
+        model_loss, class_label, _ = model_tensors(self)
+        fetches = [self.optimizer, model_loss]
+        if with_labels:
+            fetches += [class_label, self.input_labels]
+        if with_summary:
+            fetches.append(self.merge_summary)
+        res = session.run(fetches, feed_dict=self.get_feed_dict(input_data, dropout_keep_rate))
+        summary = res[-1] if with_summary else None
+        c_label, c_ans = (res[2], res[3]) if with_labels else (None, None)
+        return summary, res[1], c_label, c_ans
+
+    def evaluate(self, session, input_data):
+        model_loss, label_pred, label_prob = session.run(
+            list(model_tensors(self)), feed_dict=self.get_feed_dict(input_data, 1)
+        )
+        return model_loss, label_pred, label_prob
+
+
+def position_inputs(input_sen, input_epos, pos_max_len):
+    """
+    relative position of every step of input_sen to entity 1 and entity 2, [batch, L] each, from the entity offsets
+    input_epos [batch, 2]; the same values as the preprocessed pos1 / pos2, distances clipped to
+    +-(pos_max_len + 1) and shifted by pos_max_len + 1
+    """
+    time_len = input_sen.get_shape()[1].value
+    steps = tf.range(time_len if time_len is not None else tf.shape(input_sen)[1])
+    distance = tf.expand_dims(tf.expand_dims(steps, 0), 0) - tf.expand_dims(input_epos, -1)   # [batch, 2, L]
+    positions = tf.clip_by_value(distance, -pos_max_len - 1, pos_max_len + 1) + pos_max_len + 1
+    return positions[:, 0], positions[:, 1]
+
+
+def rnn_encoder(cell, inputs, seq_len, rnn_mode):
+    """
+    run a rnn over inputs [batch, L, emb], outputs are [batch, L, hidden]
+    'dynamic' stops at seq_len of each instance and outputs 0 after it, 'static' unrolls all L steps
+    """
+    if rnn_mode == 'dynamic':
+        outputs, _ = tf.nn.dynamic_rnn(cell, inputs, sequence_length=seq_len, dtype=tf.float32)
+        return outputs
+    inputs_us = tf.unstack(inputs, num=int(inputs.get_shape()[1]), axis=1)
+    outputs, _ = tf.contrib.rnn.static_rnn(cell, inputs_us, dtype=tf.float32)
+    return tf.stack(outputs, axis=1)
+
+
+def birnn_encoder(foward_cell, backward_cell, inputs, seq_len, rnn_mode):
+    """
+    bidirectional rnn_encoder, outputs are [batch, L, hidden * 2] with the forward half first
+    """
+    if rnn_mode == 'dynamic':
+        outputs, _ = tf.nn.bidirectional_dynamic_rnn(
+            foward_cell, backward_cell, inputs, sequence_length=seq_len, dtype=tf.float32
+        )
+        return tf.concat(outputs, 2)
+    inputs_us = tf.unstack(inputs, num=int(inputs.get_shape()[1]), axis=1)
+    outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(foward_cell, backward_cell, inputs_us, dtype=tf.float32)
+    return tf.stack(outputs, axis=1)
+
+
+def length_mask(seq_len, max_len):
+    """
+    float mask [batch, L], 1 for the first seq_len steps of each instance
+    """
+    return tf.sequence_mask(seq_len, max_len, dtype=tf.float32)
+
+
+def masked_mean(outputs, seq_len, rnn_mode):
+    """
+    average rnn outputs [batch, L, hidden] over steps, in 'dynamic' mode only the first seq_len steps count
+    """
+    if rnn_mode == 'dynamic':
+        mask = tf.expand_dims(length_mask(seq_len, tf.shape(outputs)[1]), -1)
+        return tf.reduce_sum(outputs * mask, axis=1) / tf.maximum(tf.reduce_sum(mask, axis=1), 1.0)
+    return tf.reduce_mean(outputs, axis=1)
+
+
+def masked_softmax(scores, seq_len, rnn_mode):
+    """
+    attention softmax over the last axis of scores [batch, L] or [batch, r, L]
+    in 'dynamic' mode the padding steps after seq_len get no weight
+    """
+    if rnn_mode == 'dynamic':
+        mask = length_mask(seq_len, tf.shape(scores)[-1])
+        if scores.get_shape().ndims == 3:
+            mask = tf.expand_dims(mask, 1)
+        scores -= (1.0 - mask) * 1e9
+    return tf.nn.softmax(scores)
+
+
+def select_hidden(outputs, seq_len, hidden_select, rnn_mode):
+    """
+    instance representation from rnn outputs [batch, L, hidden], output of the 'last' step or 'avg' of all steps
+    """
+    if hidden_select == 'last':
+        if rnn_mode == 'dynamic':
+            last_idx = tf.stack([tf.range(tf.shape(outputs)[0]), tf.maximum(seq_len - 1, 0)], axis=1)
+            return tf.gather_nd(outputs, last_idx)
+        return outputs[:, -1]
+    elif hidden_select == 'avg':
+        return masked_mean(outputs, seq_len, rnn_mode)
+
+
+class Cnn(Model):
     """
     Basic CNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'Cnn'
 
         # max sentence length
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # variable time steps, batches may be trimmed to their longest sentence
+        self.var_len = True
+        self.time_len = None
 
         # filter number
         self.filter_sizes = setting.filter_sizes
@@ -40,22 +234,22 @@ class Cnn(object):
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [setting.pos_num, setting.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [setting.pos_num, setting.pos_size])
@@ -90,13 +284,8 @@ class Cnn(object):
                     # Apply none linearity
                     h = tf.nn.relu(tf.nn.bias_add(conv, b), name='relu')
 
-                    # Max pooling over the outputs
-                    pooled = tf.nn.max_pool(
-                        h,
-                        ksize=[1, self.max_sentence_len - filter_size + 1, 1, 1],
-                        strides=[1, 1, 1, 1],
-                        padding='VALID', name='conv'
-                    )
+                    # Max pooling over the outputs, over all time steps so batches of any length fit
+                    pooled = tf.expand_dims(tf.reduce_max(h, axis=1), 1)
                     pooled_outputs.append(pooled)
 
             # Combine all the pooled features
@@ -131,7 +320,7 @@ class Cnn(object):
 
             # accuracy
             self.accuracy = tf.reduce_mean(
-                tf.cast(tf.equal(self.class_label, tf.argmax(self.input_labels, 1)), "float"), name="accuracy"
+                tf.cast(tf.equal(self.class_label, tf.cast(self.input_labels, tf.int64)), "float"), name="accuracy"
             )
             tf.summary.scalar('accuracy', self.accuracy)
 
@@ -144,7 +333,9 @@ class Cnn(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_out, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.fc_out, labels=self.input_labels
+            )
 
             # model loss
             self.model_loss = tf.reduce_mean(self.instance_loss)
@@ -152,45 +343,37 @@ class Cnn(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class PCnn(object):
+class PCnn(Model):
     """
     PCNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'PCnn'
 
         # max sentence length
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # variable time steps, batches may be trimmed to their longest sentence
+        self.var_len = True
+        self.time_len = None
 
         # filter number
         self.filter_sizes = setting.filter_sizes
@@ -204,26 +387,32 @@ class PCnn(object):
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
-
-            # max pooling mask
-            self.input_mask = tf.placeholder(tf.float32, [None, 3, self.max_sentence_len], name='input_mask')
-            self.pcnn_mask = tf.expand_dims(tf.transpose(self.input_mask, [0, 2, 1]), axis=1)   # [batch, 1, L, 3]
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
+        with tf.name_scope('pool_mask'):
+            # piece wise max pooling mask, [:e_first], [e_first:e_second], [e_second:]
+            p1 = tf.expand_dims(tf.reduce_min(self.input_epos, axis=1), -1)   # [batch, 1]
+            p2 = tf.expand_dims(tf.reduce_max(self.input_epos, axis=1), -1)
+            idx = tf.expand_dims(tf.range(tf.shape(self.input_sen)[1]), 0)  # [1, L]
+            self.pool_mask = tf.cast(
+                tf.stack([idx < p1, tf.logical_and(idx >= p1, idx < p2), idx >= p2], axis=1), tf.float32
+            )  # [batch, 3, L]
+            self.pcnn_mask = tf.expand_dims(tf.transpose(self.pool_mask, [0, 2, 1]), axis=1)   # [batch, 1, L, 3]
+
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [setting.pos_num, setting.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [setting.pos_num, setting.pos_size])
@@ -250,7 +439,8 @@ class PCnn(object):
                                     self.conv_input, self.filter_num, [1, filter_size], padding='same',
                                     kernel_initializer=tf.contrib.layers.xavier_initializer_conv2d()
                                 )
-                            )
+                            ),
+                            axis=1
                         )
                         conv_out = tf.expand_dims(tf.transpose(conv_out, [0, 2, 1]), axis=-1)  # [batch, feat, L, 1]
 
@@ -291,7 +481,7 @@ class PCnn(object):
 
             # accuracy
             self.accuracy = tf.reduce_mean(
-                tf.cast(tf.equal(self.class_label, tf.argmax(self.input_labels, 1)), "float"), name="accuracy"
+                tf.cast(tf.equal(self.class_label, tf.cast(self.input_labels, tf.int64)), "float"), name="accuracy"
             )
             tf.summary.scalar('accuracy', self.accuracy)
 
@@ -304,7 +494,9 @@ class PCnn(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_out, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.fc_out, labels=self.input_labels
+            )
 
             # model loss
             self.model_loss = tf.reduce_mean(self.instance_loss)
@@ -312,48 +504,37 @@ class PCnn(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_mask: input_data.mask,
+                     self.input_epos: input_data.epos,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_mask: input_data.mask,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class Cnn_Deep(object):
+class Cnn_Deep(Model):
     """
     Multi-layer CNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'Cnn_Deep'
 
         with tf.name_scope('model_input'):
             # max sentence length
             self.max_sentence_len = setting.sen_len
+            self.pos_max_len = setting.pos_max_len or setting.sen_len
+            # fixed time steps, batches are padded to max sentence length
+            self.var_len = False
 
             # filter number
             self.filter_sizes = setting.filter_sizes
@@ -369,22 +550,22 @@ class Cnn_Deep(object):
             self.class_num = setting.class_num
 
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.max_sentence_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # dropout
             self.dropout_mask = setting.dropout_mask
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [setting.pos_num, setting.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [setting.pos_num, setting.pos_size])
@@ -474,7 +655,7 @@ class Cnn_Deep(object):
 
             # accuracy
             self.accuracy = tf.reduce_mean(
-                tf.cast(tf.equal(self.class_label, tf.argmax(self.input_labels, 1)), "float"), name="accuracy"
+                tf.cast(tf.equal(self.class_label, tf.cast(self.input_labels, tf.int64)), "float"), name="accuracy"
             )
             tf.summary.scalar('accuracy', self.accuracy)
 
@@ -484,7 +665,9 @@ class Cnn_Deep(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_out, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.fc_out, labels=self.input_labels
+            )
 
             # model loss
             self.model_loss = tf.reduce_mean(self.instance_loss)
@@ -492,72 +675,67 @@ class Cnn_Deep(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
-        input_x = input_data.x
-        feed_dict = {self.input_sen: input_x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
+        feed_dict = {self.input_sen: input_data.x,
+                     self.input_epos: input_data.epos,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        input_x = input_data.x
-        feed_dict = {self.input_sen: input_x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                         self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class Rnn(object):
+class Rnn(Model):
     """
     Basic Rnn model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'Rnn'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
+
+            # sentence length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -569,7 +747,6 @@ class Rnn(object):
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
 
         # states and outputs
         with tf.name_scope('rnn_layer'):
@@ -578,16 +755,8 @@ class Rnn(object):
             self.rnn_cell = tf.nn.rnn_cell.DropoutWrapper(self.rnn_cell, output_keep_prob=self.dropout_keep_rate)
 
             # rnn
-            self.outputs, self.states = tf.contrib.rnn.static_rnn(
-                self.rnn_cell, self.emb_all_us, dtype=tf.float32
-            )
-
-            if setting.hidden_select == 'last':
-                self.output_final = self.outputs[-1]
-            elif setting.hidden_select == 'avg':
-                self.output_final = tf.reduce_mean(
-                    tf.reshape(tf.concat(self.outputs, 1), [-1, self.max_sentence_len, self.hidden_size]), axis=1
-                )
+            self.outputs = rnn_encoder(self.rnn_cell, self.emb_all, self.sen_len, self.rnn_mode)
+            self.output_final = select_hidden(self.outputs, self.sen_len, setting.hidden_select, self.rnn_mode)
 
         with tf.name_scope('fc_layer'):
             # full connection layer before softmax
@@ -606,7 +775,7 @@ class Rnn(object):
             self.class_label = tf.argmax(self.softmax_res, 1)
 
         with tf.name_scope('model_loss'):
-            self.loss = tf.nn.softmax_cross_entropy_with_logits(
+            self.loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
                 logits=self.fc_output, labels=self.input_labels
             )
             # model loss
@@ -616,70 +785,68 @@ class Rnn(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
+                     self.input_len: input_data.slen,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
+        return feed_dict
 
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
 
-
-class BiRnn(object):
+class BiRnn(Model):
     """
     Bidirectional RNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'BiRnn'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
+
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # sentence length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -691,7 +858,6 @@ class BiRnn(object):
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
 
         # states and outputs
         with tf.name_scope('rnn_layer'):
@@ -706,16 +872,10 @@ class BiRnn(object):
             )
 
             # rnn
-            self.rnn_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                self.foward_cell, self.backward_cell, self.emb_all_us, dtype=tf.float32
+            self.rnn_outputs = birnn_encoder(
+                self.foward_cell, self.backward_cell, self.emb_all, self.sen_len, self.rnn_mode
             )
-
-            if setting.hidden_select == 'last':
-                self.rnn_output = self.rnn_outputs[-1]
-            elif setting.hidden_select == 'avg':
-                self.rnn_output = tf.reduce_mean(
-                    tf.reshape(tf.concat(self.rnn_outputs, 1), [-1, self.max_sentence_len, self.hidden_size * 2]), axis=1
-                )
+            self.rnn_output = select_hidden(self.rnn_outputs, self.sen_len, setting.hidden_select, self.rnn_mode)
 
         with tf.name_scope('fc_layer'):
             self.fc_w = tf.get_variable('fc_W', [self.hidden_size * 2, self.class_num])
@@ -734,7 +894,9 @@ class BiRnn(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_output, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.fc_output, labels=self.input_labels
+            )
             # model loss
             self.model_loss = tf.reduce_mean(self.instance_loss)
 
@@ -742,46 +904,38 @@ class BiRnn(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
+                     self.input_len: input_data.slen,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_output], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Deep(object):
+class BiRnn_Deep(Model):
     """
     Bidirectional Deep RNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'BiRnn_Deep'
 
         # settings
         self.cell_type = setting.cells
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # fixed time steps, batches are padded to max sentence length
+        self.var_len = False
         self.hidden_sizes = setting.hidden_sizes
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
@@ -790,22 +944,22 @@ class BiRnn_Deep(object):
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.max_sentence_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -856,74 +1010,71 @@ class BiRnn_Deep(object):
             self.class_label = tf.argmax(self.softmax_res, 1)
 
         with tf.name_scope('model_loss'):
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
                 logits=self.fc_output, labels=self.input_labels
             )
             self.model_loss = tf.reduce_mean(self.instance_loss)
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Att(object):
-    def __init__(self, x_embedding, setting):
+class BiRnn_Att(Model):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'BiRnn_Att'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
+
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # sentence length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -935,7 +1086,6 @@ class BiRnn_Att(object):
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
 
         # states and outputs
         with tf.name_scope('rnn_layer'):
@@ -945,15 +1095,11 @@ class BiRnn_Att(object):
                 self.foward_cell = tf.nn.rnn_cell.DropoutWrapper(self.foward_cell, output_keep_prob=self.dropout_keep_rate)
                 self.backward_cell = tf.nn.rnn_cell.DropoutWrapper(self.backward_cell, output_keep_prob=self.dropout_keep_rate)
 
-                rnn_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    self.foward_cell, self.backward_cell, self.emb_all_us, dtype=tf.float32
+                rnn_outputs = birnn_encoder(
+                    self.foward_cell, self.backward_cell, self.emb_all, self.sen_len, self.rnn_mode
                 )
-                outputs_forward = [i[:, :self.hidden_size] for i in rnn_outputs]
-                outputs_backward = [i[:, self.hidden_size:] for i in rnn_outputs]
-                output_forward = tf.reshape(tf.concat(axis=1, values=outputs_forward),
-                                            [-1, self.max_sentence_len, self.hidden_size])
-                output_backward = tf.reshape(tf.concat(axis=1, values=outputs_backward),
-                                             [-1, self.max_sentence_len, self.hidden_size])
+                output_forward = rnn_outputs[:, :, :self.hidden_size]
+                output_backward = rnn_outputs[:, :, self.hidden_size:]
 
                 self.rnn_outputs = tf.add(output_forward, output_backward)
 
@@ -961,16 +1107,17 @@ class BiRnn_Att(object):
             with tf.name_scope('attention'):
                 self.attention_w = tf.get_variable('attention_omega', [self.hidden_size, 1])
                 self.attention_A = tf.reshape(
-                    tf.nn.softmax(
+                    masked_softmax(
                         tf.reshape(
                             tf.matmul(
                                 tf.reshape(tf.tanh(self.rnn_outputs), [-1, self.hidden_size]),
                                 self.attention_w
                             ),
-                            [-1, self.max_sentence_len]
-                        )
+                            [-1, tf.shape(self.rnn_outputs)[1]]
+                        ),
+                        self.sen_len, self.rnn_mode
                     ),
-                    [-1, 1, self.max_sentence_len]
+                    [-1, 1, tf.shape(self.rnn_outputs)[1]]
                 )
                 self.rnn_output = tf.reshape(tf.matmul(self.attention_A, self.rnn_outputs), [-1, self.hidden_size])
 
@@ -989,77 +1136,75 @@ class BiRnn_Att(object):
             self.class_label = tf.argmax(self.softmax_output, 1)
 
         with tf.name_scope('model_loss'):
-            self.loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_output,
-                                                                labels=self.input_labels)
+            self.loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits=self.fc_output,
+                                                                       labels=self.input_labels)
             self.l2_regular = tf.contrib.layers.apply_regularization(regularizer=tf.contrib.layers.l2_regularizer(0.0001),
-                                                                     weights_list=tf.trainable_variables())
+                                                                     weights_list=l2_weights(setting.embed_l2))
             self.model_loss = tf.reduce_mean(self.loss) + self.l2_regular
 
             tf.summary.scalar('model_loss', self.model_loss)
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
+                     self.input_len: input_data.slen,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_output], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_SelfAtt(object):
-    def __init__(self, x_embedding, setting):
+class BiRnn_SelfAtt(Model):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'BiRnn_SelfAtt'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
+
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # sentence length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -1071,7 +1216,6 @@ class BiRnn_SelfAtt(object):
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
 
         # states and outputs
         with tf.name_scope('rnn_layer'):
@@ -1083,18 +1227,15 @@ class BiRnn_SelfAtt(object):
                                                                  output_keep_prob=self.dropout_keep_rate)
                 self.backward_cell = tf.nn.rnn_cell.DropoutWrapper(self.backward_cell,
                                                                    output_keep_prob=self.dropout_keep_rate)
-                self.rnn_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    self.foward_cell, self.backward_cell, self.emb_all_us, dtype=tf.float32
-                )
-                self.output_h = tf.reshape(
-                    tf.concat(self.rnn_outputs, 1), [-1, self.max_sentence_len, self.hidden_size * 2]
+                self.output_h = birnn_encoder(
+                    self.foward_cell, self.backward_cell, self.emb_all, self.sen_len, self.rnn_mode
                 )
 
             # attention
             with tf.name_scope('attention'):
                 self.attention_Ws1 = tf.get_variable('attention_Ws1', [self.hidden_size * 2, setting.da])
                 self.attention_Ws2 = tf.get_variable('attention_Ws2', [setting.da, setting.r])
-                self.attention_A = tf.nn.softmax(
+                self.attention_A = masked_softmax(
                     tf.transpose(
                         tf.reshape(
                             tf.matmul(
@@ -1103,10 +1244,11 @@ class BiRnn_SelfAtt(object):
                                 ),
                                 self.attention_Ws2,
                             ),
-                            [-1, self.max_sentence_len, setting.r]
+                            [-1, tf.shape(self.output_h)[1], setting.r]
                         ),
                         [0, 2, 1]
                     ),
+                    self.sen_len, self.rnn_mode
                 )
                 self.M = tf.matmul(self.attention_A, self.output_h)
 
@@ -1131,7 +1273,9 @@ class BiRnn_SelfAtt(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.sen_rep, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.sen_rep, labels=self.input_labels
+            )
 
             # Frobenius norm
             self.P_att_matrix = tf.matmul(self.attention_A, tf.transpose(self.attention_A, [0, 2, 1])) - tf.eye(
@@ -1143,46 +1287,38 @@ class BiRnn_SelfAtt(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
+                     self.input_len: input_data.slen,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_output], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Res(object):
+class BiRnn_Res(Model):
     """
     Bidirectional Residual RNN model.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None):
         # model name
         self.model_name = 'BiRnn_Res'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # fixed time steps, batches are padded to max sentence length
+        self.var_len = False
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
@@ -1191,22 +1327,22 @@ class BiRnn_Res(object):
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.max_sentence_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -1241,7 +1377,7 @@ class BiRnn_Res(object):
                 strides=[1, 1, 1, 1],
                 padding='VALID'
             )
-            mp_out = tf.squeeze(pooled)
+            mp_out = tf.squeeze(pooled, axis=[1, 3])
 
         with tf.name_scope('fc_layer'):
             fc_w = tf.get_variable('fc_W', [self.hidden_size * 2, self.class_num])
@@ -1258,53 +1394,44 @@ class BiRnn_Res(object):
             self.class_label = tf.argmax(self.softmax_res, 1)
 
         with tf.name_scope('model_loss'):
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
                 logits=self.fc_output, labels=self.input_labels
             )
             self.model_loss = tf.reduce_mean(self.instance_loss)
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
+                     self.input_epos: input_data.epos,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
+        return feed_dict
 
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
 
-
-class BiRnn_Ent(object):
+class BiRnn_Ent(Model):
     """
     Bidirectional RNN model with entity description.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None, ent_embedding=None):
+        # entities are embedded by character
+        assert ent_embedding is not None, 'entity models need the character embedding'
         # model name
         self.model_name = 'BiRnn_Ent'
 
         # settings
         self.cell_type = setting.cell
         self.max_sen_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.max_ent_len = setting.ent_len
         self.hidden_size_sen = setting.hidden_size_sen
         self.hidden_size_ent = setting.hidden_size_ent
@@ -1312,35 +1439,49 @@ class BiRnn_Ent(object):
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sen_len
+        self.ent_time_len = None if self.var_len else self.max_ent_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # entity
-            self.input_e1 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e1')
-            self.input_e2 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e2')
+            self.input_e1 = input_placeholder(inputs, 'e1', tf.int32, [None, self.ent_time_len], name='input_e1')
+            self.input_e2 = input_placeholder(inputs, 'e2', tf.int32, [None, self.ent_time_len], name='input_e2')
+
+            # sentence and entity length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.input_e1_len = input_placeholder(inputs, 'e1_len', tf.int32, [None], name='input_e1_len')
+            self.input_e2_len = input_placeholder(inputs, 'e2_len', tf.int32, [None], name='input_e2_len')
+
+            # distinct entities of the batch, e1 and e2 of each instance are gathered from their encoding
+            self.input_ent, self.input_ent_len, self.input_e1_idx, self.input_e2_idx = entity_inputs(
+                self.input_e1, self.input_e2, self.input_e1_len, self.input_e2_len
+            )
+            self.sen_len = tf.minimum(self.input_len, self.max_sen_len)
+            self.ent_len = tf.minimum(self.input_ent_len, self.max_ent_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
 
-            ent_embedding = np.load('data/char_vec.npy')
-            self.embed_matrix_ent = tf.get_variable(
-                'embed_matrix_ent', ent_embedding.shape,
-                initializer=tf.constant_initializer(ent_embedding)
-            )
+            self.embed_matrix_ent = embedding_variable('embed_matrix_ent', ent_embedding, self.init_feed_dict,
+                                                       setting.embed_trainable)
 
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
@@ -1350,16 +1491,11 @@ class BiRnn_Ent(object):
             self.emb_sen = tf.nn.embedding_lookup(self.embed_matrix_x, self.input_sen)
             self.emb_pos1 = tf.nn.embedding_lookup(self.embed_matrix_pos1, self.input_pos1)
             self.emb_pos2 = tf.nn.embedding_lookup(self.embed_matrix_pos2, self.input_pos2)
-            self.emb_e1 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e1)
-            self.emb_e2 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e2)
+            self.emb_ent = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_ent)
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
 
-            self.emb_e1_us = tf.unstack(self.emb_e1, num=self.max_ent_len, axis=1)
-            self.emb_e2_us = tf.unstack(self.emb_e2, num=self.max_ent_len, axis=1)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sen_len, axis=1)
-
         # states and outputs
         with tf.name_scope('sentence_encoder'):
             with tf.variable_scope('sentence_encoder'):
@@ -1370,17 +1506,8 @@ class BiRnn_Ent(object):
                 backward_cell = tf.nn.rnn_cell.DropoutWrapper(backward_cell, output_keep_prob=self.dropout_keep_rate)
 
                 # rnn
-                sen_output, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_all_us, dtype=tf.float32
-                )
-
-                if setting.hidden_select == 'last':
-                    self.sent_output = sen_output[-1]
-                elif setting.hidden_select == 'avg':
-                    self.sent_output = tf.reduce_mean(
-                        tf.reshape(tf.concat(sen_output, 1), [-1, self.max_sen_len, self.hidden_size_sen * 2]),
-                        axis=1
-                    )
+                sen_output = birnn_encoder(foward_cell, backward_cell, self.emb_all, self.sen_len, self.rnn_mode)
+                self.sent_output = select_hidden(sen_output, self.sen_len, setting.hidden_select, self.rnn_mode)
 
         with tf.name_scope('entity_encoder'):
             with tf.variable_scope('entity_encoder'):
@@ -1388,21 +1515,11 @@ class BiRnn_Ent(object):
                 foward_cell = rnn_cell[self.cell_type](self.hidden_size_sen)
                 backward_cell = rnn_cell[self.cell_type](self.hidden_size_sen)
                 # rnn
-                ent1_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e1_us, dtype=tf.float32
-                )
-                ent2_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e2_us, dtype=tf.float32
-                )
+                ent_outputs = birnn_encoder(foward_cell, backward_cell, self.emb_ent, self.ent_len, self.rnn_mode)
                 # entity representation
-                ent1_output = tf.reduce_mean(
-                    tf.reshape(tf.concat(ent1_outputs, 1), [-1, self.max_ent_len, self.hidden_size_ent * 2]),
-                    axis=1
-                )
-                ent2_output = tf.reduce_mean(
-                    tf.reshape(tf.concat(ent2_outputs, 1), [-1, self.max_ent_len, self.hidden_size_ent * 2]),
-                    axis=1
-                )
+                self.ent_encoding = masked_mean(ent_outputs, self.ent_len, self.rnn_mode)
+                ent1_output = tf.gather(self.ent_encoding, self.input_e1_idx)
+                ent2_output = tf.gather(self.ent_encoding, self.input_e2_idx)
                 self.ent_out = tf.concat([ent1_output, ent2_output], axis=1)
 
         with tf.name_scope('joint_layer'):
@@ -1424,7 +1541,7 @@ class BiRnn_Ent(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_output, labels=self.input_labels)
+            self.loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits=self.fc_output, labels=self.input_labels)
             # model loss
             self.model_loss = tf.reduce_mean(self.loss)
 
@@ -1432,51 +1549,43 @@ class BiRnn_Ent(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
+                     self.input_epos: input_data.epos,
+                     self.input_ent: input_data.ent,
+                     self.input_e1_idx: input_data.e1_idx,
+                     self.input_e2_idx: input_data.e2_idx,
+                     self.input_len: input_data.slen,
+                     self.input_ent_len: input_data.ent_len,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Att_Ent(object):
+class BiRnn_Att_Ent(Model):
     """
     Bidirectional RNN model with attention and entity spell.
     """
 
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None, ent_embedding=None):
+        # entities are embedded by character
+        assert ent_embedding is not None, 'entity models need the character embedding'
         # model name
         self.model_name = 'BiRnn_Att_Ent'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.max_ent_len = setting.ent_len
         self.hidden_size_sen = setting.hidden_size_sen
         self.hidden_size_ent = setting.hidden_size_ent
@@ -1484,35 +1593,49 @@ class BiRnn_Att_Ent(object):
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
+        self.ent_time_len = None if self.var_len else self.max_ent_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # entity
-            self.input_e1 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e1')
-            self.input_e2 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e2')
+            self.input_e1 = input_placeholder(inputs, 'e1', tf.int32, [None, self.ent_time_len], name='input_e1')
+            self.input_e2 = input_placeholder(inputs, 'e2', tf.int32, [None, self.ent_time_len], name='input_e2')
+
+            # sentence and entity length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.input_e1_len = input_placeholder(inputs, 'e1_len', tf.int32, [None], name='input_e1_len')
+            self.input_e2_len = input_placeholder(inputs, 'e2_len', tf.int32, [None], name='input_e2_len')
+
+            # distinct entities of the batch, e1 and e2 of each instance are gathered from their encoding
+            self.input_ent, self.input_ent_len, self.input_e1_idx, self.input_e2_idx = entity_inputs(
+                self.input_e1, self.input_e2, self.input_e1_len, self.input_e2_len
+            )
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
+            self.ent_len = tf.minimum(self.input_ent_len, self.max_ent_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
 
-            ent_embedding = np.load('data/char_vec.npy')
-            self.embed_matrix_ent = tf.get_variable(
-                'embed_matrix_ent', ent_embedding.shape,
-                initializer=tf.constant_initializer(ent_embedding)
-            )
+            self.embed_matrix_ent = embedding_variable('embed_matrix_ent', ent_embedding, self.init_feed_dict,
+                                                       setting.embed_trainable)
             
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
@@ -1522,16 +1645,11 @@ class BiRnn_Att_Ent(object):
             self.emb_sen = tf.nn.embedding_lookup(self.embed_matrix_x, self.input_sen)
             self.emb_pos1 = tf.nn.embedding_lookup(self.embed_matrix_pos1, self.input_pos1)
             self.emb_pos2 = tf.nn.embedding_lookup(self.embed_matrix_pos2, self.input_pos2)
-            self.emb_e1 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e1)
-            self.emb_e2 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e2)
+            self.emb_ent = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_ent)
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
 
-            self.emb_e1_us = tf.unstack(self.emb_e1, num=self.max_ent_len, axis=1)
-            self.emb_e2_us = tf.unstack(self.emb_e2, num=self.max_ent_len, axis=1)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
-
         # states and outputs
         with tf.name_scope('sentence_encoder'):
             with tf.variable_scope('sentence_encoder'):
@@ -1542,13 +1660,10 @@ class BiRnn_Att_Ent(object):
                 backward_cell = tf.nn.rnn_cell.DropoutWrapper(backward_cell, output_keep_prob=self.dropout_keep_rate)
 
                 # rnn
-                rnn_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_all_us, dtype=tf.float32
+                self.sent_outputs = birnn_encoder(
+                    foward_cell, backward_cell, self.emb_all, self.sen_len, self.rnn_mode
                 )
 
-                self.sent_outputs = tf.reshape(tf.concat(rnn_outputs, axis=1),
-                                               [-1, self.max_sentence_len, self.hidden_size_sen * 2])
-
         with tf.name_scope('entity_encoder'):
             with tf.variable_scope('entity_encoder'):
                 # cell
@@ -1556,29 +1671,13 @@ class BiRnn_Att_Ent(object):
                 backward_cell = rnn_cell[self.cell_type](self.hidden_size_sen)
 
                 # rnn
-                ent1_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e1_us, dtype=tf.float32
+                ent_outputs = birnn_encoder(foward_cell, backward_cell, self.emb_ent, self.ent_len, self.rnn_mode)
+                ent_outputs = tf.add(
+                    ent_outputs[:, :, :self.hidden_size_ent], ent_outputs[:, :, self.hidden_size_ent:]
                 )
-                e1_outputs_forward = [i[:, :self.hidden_size_ent] for i in ent1_outputs]
-                e1_outputs_backward = [i[:, self.hidden_size_ent:] for i in ent1_outputs]
-                e1_outputs_forward = tf.reshape(tf.concat(axis=1, values=e1_outputs_forward),
-                                                [-1, self.max_ent_len, self.hidden_size_ent])
-                e1_outputs_backward = tf.reshape(tf.concat(axis=1, values=e1_outputs_backward),
-                                                 [-1, self.max_ent_len, self.hidden_size_ent])
-                e1_outputs = tf.add(e1_outputs_forward, e1_outputs_backward)
-                e1_output = tf.reduce_mean(e1_outputs, 1)
-
-                ent2_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e2_us, dtype=tf.float32
-                )
-                e2_outputs_forward = [i[:, :self.hidden_size_ent] for i in ent2_outputs]
-                e2_outputs_backward = [i[:, self.hidden_size_ent:] for i in ent2_outputs]
-                e2_output_forward = tf.reshape(tf.concat(axis=1, values=e2_outputs_forward),
-                                               [-1, self.max_ent_len, self.hidden_size_ent])
-                e2_output_backward = tf.reshape(tf.concat(axis=1, values=e2_outputs_backward),
-                                                [-1, self.max_ent_len, self.hidden_size_ent])
-                e2_outputs = tf.add(e2_output_forward, e2_output_backward)
-                e2_output = tf.reduce_mean(e2_outputs, 1)
+                self.ent_encoding = masked_mean(ent_outputs, self.ent_len, self.rnn_mode)
+                e1_output = tf.gather(self.ent_encoding, self.input_e1_idx)
+                e2_output = tf.gather(self.ent_encoding, self.input_e2_idx)
 
                 self.ent_out = tf.concat([e1_output, e2_output], axis=1)
                 self.ent_att = tf.expand_dims(tf.subtract(e1_output, e2_output), -1)
@@ -1586,7 +1685,7 @@ class BiRnn_Att_Ent(object):
         with tf.name_scope('attention_layer'):
             self.attention_w = tf.get_variable('attention_omega', [self.sent_outputs.shape[-1], self.ent_att.shape[-2]])
             self.attention_A = tf.reshape(
-                tf.nn.softmax(
+                masked_softmax(
                     tf.squeeze(
                         tf.matmul(
                             tf.reshape(
@@ -1594,13 +1693,15 @@ class BiRnn_Att_Ent(object):
                                     tf.reshape(tf.tanh(self.sent_outputs), [-1, int(self.sent_outputs.shape[-1])]),
                                     self.attention_w
                                 ),
-                                [-1, self.max_sentence_len, self.hidden_size_ent]
+                                [-1, tf.shape(self.sent_outputs)[1], self.hidden_size_ent]
                             ),
                             self.ent_att
                         ),
-                    )
+                        axis=-1
+                    ),
+                    self.sen_len, self.rnn_mode
                 ),
-                [-1, 1, self.max_sentence_len]
+                [-1, 1, tf.shape(self.sent_outputs)[1]]
             )
             self.att_output = tf.reshape(tf.matmul(self.attention_A, self.sent_outputs),
                                          [-1, int(self.sent_outputs.shape[-1])])
@@ -1625,7 +1726,7 @@ class BiRnn_Att_Ent(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_output, labels=self.input_labels)
+            self.loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits=self.fc_output, labels=self.input_labels)
             # model loss
             self.model_loss = tf.reduce_mean(self.loss)
 
@@ -1633,50 +1734,42 @@ class BiRnn_Att_Ent(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
+                     self.input_epos: input_data.epos,
+                     self.input_ent: input_data.ent,
+                     self.input_e1_idx: input_data.e1_idx,
+                     self.input_e2_idx: input_data.e2_idx,
+                     self.input_len: input_data.slen,
+                     self.input_ent_len: input_data.ent_len,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Cnn_Ent(object):
+class BiRnn_Cnn_Ent(Model):
     """
     A model use birnn and cnn.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None, ent_embedding=None):
+        # entities are embedded by character
+        assert ent_embedding is not None, 'entity models need the character embedding'
         # model name
         self.model_name = 'BiRnn_Cnn_Ent'
 
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
         self.max_ent_len = setting.ent_len
         self.hidden_size_sen = setting.hidden_size_sen
         self.hidden_size_ent = setting.hidden_size_ent
@@ -1686,35 +1779,49 @@ class BiRnn_Cnn_Ent(object):
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
+        self.rnn_mode = setting.rnn_mode
+        # dynamic rnn takes batches trimmed to their longest sentence, static rnn unrolls a fixed length
+        self.var_len = self.rnn_mode == 'dynamic'
+        self.time_len = None if self.var_len else self.max_sentence_len
+        self.ent_time_len = None if self.var_len else self.max_ent_len
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.time_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # entity
-            self.input_e1 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e1')
-            self.input_e2 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e2')
+            self.input_e1 = input_placeholder(inputs, 'e1', tf.int32, [None, self.ent_time_len], name='input_e1')
+            self.input_e2 = input_placeholder(inputs, 'e2', tf.int32, [None, self.ent_time_len], name='input_e2')
+
+            # sentence and entity length
+            self.input_len = input_placeholder(inputs, 'len', tf.int32, [None], name='input_len')
+            self.input_e1_len = input_placeholder(inputs, 'e1_len', tf.int32, [None], name='input_e1_len')
+            self.input_e2_len = input_placeholder(inputs, 'e2_len', tf.int32, [None], name='input_e2_len')
+
+            # distinct entities of the batch, e1 and e2 of each instance are gathered from their encoding
+            self.input_ent, self.input_ent_len, self.input_e1_idx, self.input_e2_idx = entity_inputs(
+                self.input_e1, self.input_e2, self.input_e1_len, self.input_e2_len
+            )
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
+            self.ent_len = tf.minimum(self.input_ent_len, self.max_ent_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
 
-            ent_embedding = np.load('data/char_vec.npy')
-            self.embed_matrix_ent = tf.get_variable(
-                'embed_matrix_ent', ent_embedding.shape,
-                initializer=tf.constant_initializer(ent_embedding)
-            )
+            self.embed_matrix_ent = embedding_variable('embed_matrix_ent', ent_embedding, self.init_feed_dict,
+                                                       setting.embed_trainable)
 
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
@@ -1724,12 +1831,7 @@ class BiRnn_Cnn_Ent(object):
             self.emb_sen = tf.nn.embedding_lookup(self.embed_matrix_x, self.input_sen)
             self.emb_pos1 = tf.nn.embedding_lookup(self.embed_matrix_pos1, self.input_pos1)
             self.emb_pos2 = tf.nn.embedding_lookup(self.embed_matrix_pos2, self.input_pos2)
-            self.emb_e1 = tf.nn.embedding_lookup(self.ent_embedding, self.input_e1)
-            self.emb_e2 = tf.nn.embedding_lookup(self.ent_embedding, self.input_e2)
-
-            self.emb_sen_us = tf.unstack(self.emb_sen, num=self.max_sentence_len, axis=1)
-            self.emb_e1_us = tf.unstack(self.emb_e1, num=self.max_ent_len, axis=1)
-            self.emb_e2_us = tf.unstack(self.emb_e2, num=self.max_ent_len, axis=1)
+            self.emb_ent = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_ent)
 
         # states and outputs
         with tf.name_scope('sentence_encoder'):
@@ -1742,11 +1844,9 @@ class BiRnn_Cnn_Ent(object):
                     backward_cell = tf.nn.rnn_cell.DropoutWrapper(backward_cell, output_keep_prob=self.dropout_keep_rate)
 
                     # rnn
-                    sen_rnn_output, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                        foward_cell, backward_cell, self.emb_sen_us, dtype=tf.float32
+                    self.sen_rnn_output = birnn_encoder(
+                        foward_cell, backward_cell, self.emb_sen, self.sen_len, self.rnn_mode
                     )
-                    self.sen_rnn_output = tf.reshape(tf.concat(sen_rnn_output, axis=1),
-                                                     [-1, self.max_sentence_len, self.hidden_size_sen * 2])
 
             with tf.name_scope('add_pos'):
                 # concat embeddings
@@ -1775,13 +1875,8 @@ class BiRnn_Cnn_Ent(object):
                         # Apply none linearity
                         h = tf.nn.relu(tf.nn.bias_add(conv, b), name='relu')
 
-                        # Max pooling over the outputs
-                        pooled = tf.nn.max_pool(
-                            h,
-                            ksize=[1, self.max_sentence_len - filter_size + 1, 1, 1],
-                            strides=[1, 1, 1, 1],
-                            padding='VALID', name='conv'
-                        )
+                        # Max pooling over the outputs, over all time steps so batches of any length fit
+                        pooled = tf.expand_dims(tf.reduce_max(h, axis=1), 1)
                         pooled_outputs.append(pooled)
 
                 # Combine all the pooled features
@@ -1797,22 +1892,12 @@ class BiRnn_Cnn_Ent(object):
                 # cell
                 foward_cell = rnn_cell[self.cell_type](self.hidden_size_ent)
                 backward_cell = rnn_cell[self.cell_type](self.hidden_size_ent)
-                # rnnv
-                ent1_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e1_us, dtype=tf.float32
-                )
-                ent2_outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                    foward_cell, backward_cell, self.emb_e2_us, dtype=tf.float32
-                )
+                # rnn
+                ent_outputs = birnn_encoder(foward_cell, backward_cell, self.emb_ent, self.ent_len, self.rnn_mode)
                 # entity representation
-                ent1_output = tf.reduce_mean(
-                    tf.reshape(tf.concat(ent1_outputs, 1), [-1, self.max_ent_len, self.hidden_size_ent * 2]),
-                    axis=1
-                )
-                ent2_output = tf.reduce_mean(
-                    tf.reshape(tf.concat(ent2_outputs, 1), [-1, self.max_ent_len, self.hidden_size_ent * 2]),
-                    axis=1
-                )
+                self.ent_encoding = masked_mean(ent_outputs, self.ent_len, self.rnn_mode)
+                ent1_output = tf.gather(self.ent_encoding, self.input_e1_idx)
+                ent2_output = tf.gather(self.ent_encoding, self.input_e2_idx)
                 self.ent_out = tf.concat([ent1_output, ent2_output], axis=1)
 
         with tf.name_scope('joint_layer'):
@@ -1845,7 +1930,7 @@ class BiRnn_Cnn_Ent(object):
 
             # accuracy
             self.accuracy = tf.reduce_mean(
-                tf.cast(tf.equal(self.class_label, tf.argmax(self.input_labels, 1)), "float"), name="accuracy"
+                tf.cast(tf.equal(self.class_label, tf.cast(self.input_labels, tf.int64)), "float"), name="accuracy"
             )
             tf.summary.scalar('accuracy', self.accuracy)
 
@@ -1858,7 +1943,9 @@ class BiRnn_Cnn_Ent(object):
 
         with tf.name_scope('model_loss'):
             # choose the min loss instance index
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(logits=self.fc_out, labels=self.input_labels)
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=self.fc_out, labels=self.input_labels
+            )
 
             # model loss
             self.model_loss = tf.reduce_mean(self.instance_loss)
@@ -1866,50 +1953,44 @@ class BiRnn_Cnn_Ent(object):
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
+                     self.input_epos: input_data.epos,
+                     self.input_ent: input_data.ent,
+                     self.input_e1_idx: input_data.e1_idx,
+                     self.input_e2_idx: input_data.e2_idx,
+                     self.input_len: input_data.slen,
+                     self.input_ent_len: input_data.ent_len,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Res_Ent(object):
+class BiRnn_Res_Ent(Model):
     """
     Bidirectional Residual RNN model with entity spell.
     """
-    def __init__(self, x_embedding, setting):
+    def __init__(self, x_embedding, setting, inputs=None, ent_embedding=None):
+        # entities are embedded by character
+        assert ent_embedding is not None, 'entity models need the character embedding'
         # model name
         self.model_name = 'BiRnn_Res_Ent'
 
         # settings
         self.cell_type = setting.cell
         self.max_sen_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # fixed time steps, batches are padded to max sentence length
+        self.var_len = False
         self.max_ent_len = setting.ent_len
         self.hidden_size_sen = setting.hidden_size_sen
         self.hidden_size_ent = setting.hidden_size_ent
@@ -1920,32 +2001,32 @@ class BiRnn_Res_Ent(object):
 
         with tf.name_scope('model_input'):
             # inputs
-            self.input_sen = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            self.input_sen = input_placeholder(inputs, 'x', tf.int32, [None, self.max_sen_len], name='input_sen')
+            # integer class labels
+            self.input_labels = input_placeholder(inputs, 'y', tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sen_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = input_placeholder(inputs, 'epos', tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
 
             # entity
-            self.input_e1 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e1')
-            self.input_e2 = tf.placeholder(tf.int32, [None, self.max_ent_len], name='input_e2')
+            self.input_e1 = input_placeholder(inputs, 'e1', tf.int32, [None, self.max_ent_len], name='input_e1')
+            self.input_e2 = input_placeholder(inputs, 'e2', tf.int32, [None, self.max_ent_len], name='input_e2')
+
+            # distinct entities of the batch, e1 and e2 of each instance are gathered from their encoding
+            self.input_ent, _, self.input_e1_idx, self.input_e2_idx = entity_inputs(self.input_e1, self.input_e2)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
 
-            ent_embedding = np.load('data/char_vec.npy')
-            self.embed_matrix_ent = tf.get_variable(
-                'embed_matrix_ent', ent_embedding.shape,
-                initializer=tf.constant_initializer(ent_embedding)
-            )
+            self.embed_matrix_ent = embedding_variable('embed_matrix_ent', ent_embedding, self.init_feed_dict,
+                                                       setting.embed_trainable)
 
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
@@ -1955,8 +2036,7 @@ class BiRnn_Res_Ent(object):
             self.emb_sen = tf.nn.embedding_lookup(self.embed_matrix_x, self.input_sen)
             self.emb_pos1 = tf.nn.embedding_lookup(self.embed_matrix_pos1, self.input_pos1)
             self.emb_pos2 = tf.nn.embedding_lookup(self.embed_matrix_pos2, self.input_pos2)
-            self.emb_e1 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e1)
-            self.emb_e2 = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_e2)
+            self.emb_ent = tf.nn.embedding_lookup(self.embed_matrix_ent, self.input_ent)
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
@@ -1984,7 +2064,7 @@ class BiRnn_Res_Ent(object):
                     strides=[1, 1, 1, 1],
                     padding='VALID'
                 )
-                mp_out = tf.squeeze(pooled)
+                mp_out = tf.squeeze(pooled, axis=[1, 3])
                 self.sen_output = mp_out
 
         with tf.name_scope('entity_encoder'):
@@ -1993,15 +2073,13 @@ class BiRnn_Res_Ent(object):
                 foward_cell = rnn_cell[self.cell_type](self.hidden_size_sen)
                 backward_cell = rnn_cell[self.cell_type](self.hidden_size_sen)
                 # rnn
-                ent1_outputs, _, _ = tf.contrib.rnn.stack_bidirectional_dynamic_rnn(
-                    [foward_cell], [backward_cell], self.emb_e1, dtype=tf.float32
-                )
-                ent2_outputs, _, _ = tf.contrib.rnn.stack_bidirectional_dynamic_rnn(
-                    [foward_cell], [backward_cell], self.emb_e2, dtype=tf.float32
+                ent_outputs, _, _ = tf.contrib.rnn.stack_bidirectional_dynamic_rnn(
+                    [foward_cell], [backward_cell], self.emb_ent, dtype=tf.float32
                 )
                 # entity representation
-                ent1_output = tf.reduce_mean(ent1_outputs, axis=1)
-                ent2_output = tf.reduce_mean(ent2_outputs, axis=1)
+                self.ent_encoding = tf.reduce_mean(ent_outputs, axis=1)
+                ent1_output = tf.gather(self.ent_encoding, self.input_e1_idx)
+                ent2_output = tf.gather(self.ent_encoding, self.input_e2_idx)
                 self.ent_out = tf.concat([ent1_output, ent2_output], axis=1)
 
         with tf.name_scope('joint_layer'):
@@ -2022,47 +2100,34 @@ class BiRnn_Res_Ent(object):
             self.class_label = tf.argmax(self.softmax_res, 1)
 
         with tf.name_scope('model_loss'):
-            self.instance_loss = tf.nn.softmax_cross_entropy_with_logits(
+            self.instance_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
                 logits=self.fc_output, labels=self.input_labels
             )
             self.model_loss = tf.reduce_mean(self.instance_loss)
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.model_loss)
+            self.optimizer = minimize(self.model_loss, setting)
 
         # tensor board summary
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        if input_data is None:
+            # every input except dropout comes from the tf.data iterator
+            return {self.dropout_keep_rate: dropout_keep_rate}
         feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
+                     self.input_epos: input_data.epos,
+                     self.input_ent: input_data.ent,
+                     self.input_e1_idx: input_data.e1_idx,
+                     self.input_e2_idx: input_data.e2_idx,
                      self.input_labels: input_data.y,
                      self.dropout_keep_rate: dropout_keep_rate
                      }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_loss = session.run([self.merge_summary, self.model_loss], feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        feed_dict = {self.input_sen: input_data.x,
-                     self.input_pos1: input_data.pos1,
-                     self.input_pos2: input_data.pos2,
-                     self.input_e1: input_data.e1,
-                     self.input_e2: input_data.e2,
-                     self.input_labels: input_data.y,
-                     self.dropout_keep_rate: 1}
-        model_loss, label_pred, label_prob = session.run(
-            [self.model_loss, self.class_label, self.softmax_res], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
 
 
-class BiRnn_Mi(object):
+class BiRnn_Mi(Model):
     """
     Bidirectional RNN model with multi-instance learning.
     """
@@ -2073,35 +2138,43 @@ class BiRnn_Mi(object):
         # settings
         self.cell_type = setting.cell
         self.max_sentence_len = setting.sen_len
+        self.pos_max_len = setting.pos_max_len or setting.sen_len
+        # fixed time steps, batches are padded to max sentence length
+        self.var_len = False
         self.hidden_size = setting.hidden_size
         self.class_num = setting.class_num
         self.pos_num = setting.pos_num
         self.pos_size = setting.pos_size
         self.learning_rate = setting.learning_rate
-        self.bag_num = setting.bag_num
+        self.rnn_mode = setting.rnn_mode
 
         with tf.name_scope('input_layer'):
             # shape of bags
             self.bag_shapes = tf.placeholder(tf.int32, [None], name='bag_shapes')
+            self.bag_num = tf.shape(self.bag_shapes)[0] - 1
             self.instance_num = self.bag_shapes[-1]
 
             # inputs
             self.input_sen = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_sen')
-            self.input_labels = tf.placeholder(tf.int32, [None, self.class_num], name='labels')
+            # integer class labels of the bags
+            self.input_labels = tf.placeholder(tf.int32, [None], name='labels')
 
-            # position feature
-            self.input_pos1 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos1')
-            self.input_pos2 = tf.placeholder(tf.int32, [None, self.max_sentence_len], name='input_pos2')
+            # entity offsets, the position features are computed from them in the graph
+            self.input_epos = tf.placeholder(tf.int32, [None, 2], name='input_epos')
+            self.input_pos1, self.input_pos2 = position_inputs(self.input_sen, self.input_epos, self.pos_max_len)
+
+            # sentence length
+            self.input_len = tf.placeholder(tf.int32, [None], name='input_len')
+            self.sen_len = tf.minimum(self.input_len, self.max_sentence_len)
 
             # dropout keep probability
             self.dropout_keep_rate = tf.placeholder(tf.float32, name="dropout_keep_rate")
 
         with tf.name_scope('embedding_layer'):
-            # embedding matrix
-            self.embed_matrix_x = tf.get_variable(
-                'embed_matrix_x', x_embedding.shape,
-                initializer=tf.constant_initializer(x_embedding)
-            )
+            # embedding matrix, its values are fed to the initializer by init_feed_dict
+            self.init_feed_dict = {}
+            self.embed_matrix_x = embedding_variable('embed_matrix_x', x_embedding, self.init_feed_dict,
+                                                     setting.embed_trainable)
             self.embed_size_x = int(self.embed_matrix_x.get_shape()[1])
             self.embed_matrix_pos1 = tf.get_variable('embed_matrix_pos1', [self.pos_num, self.pos_size])
             self.embed_matrix_pos2 = tf.get_variable('embed_matrix_pos2', [self.pos_num, self.pos_size])
@@ -2113,7 +2186,6 @@ class BiRnn_Mi(object):
 
             # concat embeddings
             self.emb_all = tf.concat([self.emb_sen, self.emb_pos1, self.emb_pos2], 2)
-            self.emb_all_us = tf.unstack(self.emb_all, num=self.max_sentence_len, axis=1)
 
         # states and outputs
         with tf.name_scope('sentence_encoder'):
@@ -2128,72 +2200,55 @@ class BiRnn_Mi(object):
             )
 
             # rnn
-            self.outputs, _, _ = tf.contrib.rnn.static_bidirectional_rnn(
-                self.foward_cell, self.backward_cell, self.emb_all_us, dtype=tf.float32
+            self.outputs = birnn_encoder(
+                self.foward_cell, self.backward_cell, self.emb_all, self.sen_len, self.rnn_mode
             )
-            if setting.hidden_select == 'last':
-                self.sen_emb = self.outputs[-1]
-            elif setting.hidden_select == 'avg':
-                self.sen_emb = tf.reduce_mean(
-                    tf.reshape(tf.concat(self.outputs, 1), [-1, self.max_sentence_len, self.hidden_size * 2]), axis=1
-                )
+            self.sen_emb = select_hidden(self.outputs, self.sen_len, setting.hidden_select, self.rnn_mode)
 
         with tf.name_scope('sentence_attention'):
-            # sentence-level attention layer
-            sen_repre = []
-            sen_alpha = []
-            sen_s = []
-            sen_out = []
-            self.prob = []
-            self.predictions = []
-            self.loss = []
-            self.accuracy = []
-            self.total_loss = 0.0
-
+            # sentence-level attention layer, segment operations over the flat instances keyed by bag ids
             self.sen_a = tf.get_variable('attention_A', [self.hidden_size * 2])
             self.sen_r = tf.get_variable('query_r', [self.hidden_size * 2, 1])
             relation_embedding = tf.get_variable('relation_embedding', [self.class_num, self.hidden_size * 2])
             sen_d = tf.get_variable('bias_d', [self.class_num])
 
-            for i in range(self.bag_num):
-                sen_repre.append(tf.tanh(self.sen_emb[self.bag_shapes[i]:self.bag_shapes[i + 1]]))
-                bag_size = self.bag_shapes[i + 1] - self.bag_shapes[i]
+            # bag id of each instance, count the bag starts up to the instance
+            bag_starts = self.bag_shapes[1:-1]
+            self.bag_ids = tf.cumsum(
+                tf.unsorted_segment_sum(tf.ones_like(bag_starts), bag_starts, self.instance_num)
+            )
 
-                sen_alpha.append(
-                    tf.reshape(
-                        tf.nn.softmax(
-                            tf.reshape(tf.matmul(tf.multiply(sen_repre[i], self.sen_a), self.sen_r), [bag_size])
-                        ),
-                        [1, bag_size]
-                    )
-                )
+            sen_repre = tf.tanh(self.sen_emb)
+            sen_score = tf.reshape(tf.matmul(tf.multiply(sen_repre, self.sen_a), self.sen_r), [-1])
 
-                sen_s.append(tf.reshape(tf.matmul(sen_alpha[i], sen_repre[i]), [self.hidden_size * 2, 1]))
-                sen_out.append(tf.add(tf.reshape(tf.matmul(relation_embedding, sen_s[i]), [self.class_num]), sen_d))
+            # softmax of the instance scores inside each bag
+            bag_max = tf.unsorted_segment_max(sen_score, self.bag_ids, self.bag_num)
+            sen_exp = tf.exp(sen_score - tf.gather(bag_max, self.bag_ids))
+            bag_sum = tf.unsorted_segment_sum(sen_exp, self.bag_ids, self.bag_num)
+            self.sen_alpha = sen_exp / tf.gather(bag_sum, self.bag_ids)
 
-                self.prob.append(tf.nn.softmax(sen_out[i]))
+            # bag representation, [bag_num, hidden * 2]
+            sen_s = tf.unsorted_segment_sum(tf.expand_dims(self.sen_alpha, -1) * sen_repre, self.bag_ids, self.bag_num)
+            sen_out = tf.matmul(sen_s, relation_embedding, transpose_b=True) + sen_d
 
-                with tf.name_scope("output"):
-                    self.predictions.append(tf.argmax(self.prob[i], 0, name="predictions"))
+            self.prob = tf.nn.softmax(sen_out)
 
-                with tf.name_scope("loss"):
-                    self.loss.append(tf.reduce_mean(
-                        tf.nn.softmax_cross_entropy_with_logits(logits=sen_out[i], labels=self.input_labels[i])))
-                    if i == 0:
-                        self.total_loss = self.loss[i]
-                    else:
-                        self.total_loss += self.loss[i]
+            with tf.name_scope("output"):
+                self.predictions = tf.argmax(self.prob, 1, name="predictions")
 
-                with tf.name_scope("accuracy"):
-                    self.accuracy.append(
-                        tf.reduce_mean(tf.cast(
-                            tf.equal(self.predictions[i], tf.argmax(self.input_labels[i], 0)), "float"
-                        ), name="accuracy"))
+            with tf.name_scope("loss"):
+                # loss of each bag, summed over the batch
+                self.loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits=sen_out, labels=self.input_labels)
+                self.total_loss = tf.reduce_sum(self.loss)
+
+            with tf.name_scope("accuracy"):
+                self.accuracy = tf.reduce_mean(
+                    tf.cast(tf.equal(self.predictions, tf.cast(self.input_labels, tf.int64)), "float"), name="accuracy"
+                )
 
         with tf.name_scope('optimizer'):
             # optimizer
-            self.optimizer = opt_method[setting.optimizer](learning_rate=setting.learning_rate).minimize(
-                self.total_loss)
+            self.optimizer = minimize(self.total_loss, setting)
 
         # tensor board summary
         tf.summary.histogram('sen_a', self.sen_a)
@@ -2201,58 +2256,14 @@ class BiRnn_Mi(object):
         tf.summary.scalar('loss', self.total_loss)
         self.merge_summary = tf.summary.merge_all()
 
-    def fit(self, session, input_data, dropout_keep_rate):
-        total_shape = [0]
-        total_num = 0
-        total_x = []
-        total_pos1 = []
-        total_pos2 = []
-        for bag_idx in range(len(input_data.x)):
-            total_num += len(input_data.x[bag_idx])
-            total_shape.append(total_num)
-            for sent in input_data.x[bag_idx]:
-                total_x.append(sent)
-            for pos1 in input_data.pos1[bag_idx]:
-                total_pos1.append(pos1)
-            for pos2 in input_data.pos2[bag_idx]:
-                total_pos2.append(pos2)
+    def get_feed_dict(self, input_data, dropout_keep_rate):
+        # instance features are flat, bag_shapes gives the instance range of each bag
         feed_dict = {
-            self.bag_shapes: total_shape,
-            self.input_sen: total_x,
-            self.input_pos1: total_pos1,
-            self.input_pos2: total_pos2,
+            self.bag_shapes: input_data.bag_shapes,
+            self.input_sen: input_data.x,
+            self.input_epos: input_data.epos,
+            self.input_len: input_data.slen,
             self.input_labels: input_data.y,
             self.dropout_keep_rate: dropout_keep_rate
         }
-        session.run(self.optimizer, feed_dict=feed_dict)
-        summary, model_accuracy, model_loss = session.run([self.merge_summary, self.accuracy, self.total_loss],
-                                                          feed_dict=feed_dict)
-        return summary, model_loss
-
-    def evaluate(self, session, input_data):
-        total_shape = [0]
-        total_num = 0
-        total_x = []
-        total_pos1 = []
-        total_pos2 = []
-        for bag_idx in range(len(input_data.x)):
-            total_num += len(input_data.x[bag_idx])
-            total_shape.append(total_num)
-            for sent in input_data.x[bag_idx]:
-                total_x.append(sent)
-            for pos1 in input_data.pos1[bag_idx]:
-                total_pos1.append(pos1)
-            for pos2 in input_data.pos2[bag_idx]:
-                total_pos2.append(pos2)
-        feed_dict = {
-            self.bag_shapes: total_shape,
-            self.input_sen: total_x,
-            self.input_pos1: total_pos1,
-            self.input_pos2: total_pos2,
-            self.input_labels: input_data.y,
-            self.dropout_keep_rate: 1
-        }
-        model_loss, label_pred, label_prob = session.run(
-            [self.total_loss, self.predictions, self.prob], feed_dict=feed_dict
-        )
-        return model_loss, label_pred, label_prob
+        return feed_dict
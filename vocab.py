@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import hashlib
+import numpy as np
+
+# files of a vocabulary store, all of them can be memory mapped
+vocab_files = ('vec', 'tokens', 'token_offsets', 'hash', 'hash_ids')
+
+
+def to_utf8(token):
+    return token.encode('utf8') if isinstance(token, unicode) else token
+
+
+def token_hash(tokens):
+    """
+    64 bit hash of each token, the same in every process and run
+    """
+    if len(tokens) == 0:
+        return np.zeros([0], dtype='<u8')
+    digests = ''.join(hashlib.md5(to_utf8(token)).digest()[:8] for token in tokens)
+    return np.frombuffer(digests, dtype='<u8')
+
+
+def save_vocab(prefix, tokens, embedding):
+    """
+    write a vocabulary store, {prefix}_vec.npy is the embedding matrix, tokens are in id order
+    token bytes are in {prefix}_tokens.npy and sliced by {prefix}_token_offsets.npy, the token to id index is the
+    sorted token hashes in {prefix}_hash.npy with their ids in {prefix}_hash_ids.npy
+    """
+    assert len(tokens) == len(embedding)
+    token_bytes = [to_utf8(token) for token in tokens]
+    token_offsets = np.concatenate([[0], np.cumsum([len(b) for b in token_bytes])]).astype(np.int64)
+    hashes = token_hash(tokens)
+    assert len(np.unique(hashes)) == len(tokens), 'hash collision in the vocabulary'
+    hash_ids = np.argsort(hashes, kind='mergesort').astype(np.int64)
+
+    np.save('{}_vec.npy'.format(prefix), embedding)
+    np.save('{}_tokens.npy'.format(prefix), np.frombuffer(''.join(token_bytes), dtype=np.uint8))
+    np.save('{}_token_offsets.npy'.format(prefix), token_offsets)
+    np.save('{}_hash.npy'.format(prefix), hashes[hash_ids])
+    np.save('{}_hash_ids.npy'.format(prefix), hash_ids)
+
+
+def vocab_exists(prefix, source=None):
+    """
+    whether the store of prefix is complete and, if source is given, newer than it
+    """
+    files = ['{}_{}.npy'.format(prefix, name) for name in vocab_files]
+    if not all(os.path.exists(fn) for fn in files):
+        return False
+    return source is None or min(os.path.getmtime(fn) for fn in files) >= os.path.getmtime(source)
+
+
+class TokenArray(object):
+    """
+    id to token, replaces the id2x dict
+    """
+    def __init__(self, token_bytes, token_offsets):
+        self.token_bytes = token_bytes
+        self.token_offsets = token_offsets
+
+    def __len__(self):
+        return len(self.token_offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.utf8(idx).decode('utf8')
+
+    def utf8(self, idx):
+        """
+        utf-8 bytes of token idx
+        """
+        return self.token_bytes[self.token_offsets[idx]: self.token_offsets[idx + 1]].tostring()
+
+
+class Vocab(object):
+    """
+    memory mapped vocabulary store written by save_vocab, token to id by vocab[token], replaces the x2id dict
+    """
+    def __init__(self, prefix, mmap_mode='r'):
+        self.embedding = np.load('{}_vec.npy'.format(prefix), mmap_mode=mmap_mode)
+        self.tokens = TokenArray(np.load('{}_tokens.npy'.format(prefix), mmap_mode=mmap_mode),
+                                 np.load('{}_token_offsets.npy'.format(prefix), mmap_mode=mmap_mode))
+        self.hashes = np.load('{}_hash.npy'.format(prefix), mmap_mode=mmap_mode)
+        self.hash_ids = np.load('{}_hash_ids.npy'.format(prefix), mmap_mode=mmap_mode)
+        self.unk_id = self[u'_UNK']
+        self.blank_id = self[u'_BLANK']
+
+    def __len__(self):
+        return len(self.hash_ids)
+
+    def lookup(self, tokens, default=None):
+        """
+        ids of a list of tokens in one vectorized search, default (_UNK id if None) for unknown tokens
+        only the distinct tokens are hashed and searched, corpus tokens repeat a lot
+        """
+        if len(tokens) == 0:
+            return np.zeros([0], dtype=np.int64)
+        unique_tokens, inverse = np.unique(np.asarray([to_utf8(token) for token in tokens], dtype=object),
+                                           return_inverse=True)
+        hashes = token_hash(unique_tokens)
+        pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        found = self.hashes[pos] == hashes
+        # a hash match of an unknown token is a collision, the bytes of each found token are compared
+        found[found] = [self.tokens.utf8(idx) == token
+                        for idx, token in zip(self.hash_ids[pos[found]], unique_tokens[found])]
+        ids = np.where(found, self.hash_ids[pos], self.unk_id if default is None else default).astype(np.int64)
+        return ids[inverse]
+
+    def __contains__(self, token):
+        return self.lookup([token], -1)[0] >= 0
+
+    def __getitem__(self, token):
+        idx = self.lookup([token], -1)[0]
+        if idx < 0:
+            raise KeyError(token)
+        return idx